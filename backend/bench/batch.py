@@ -0,0 +1,104 @@
+# backend/bench/batch.py
+
+"""
+Bulk analysis against the stub batch server.
+
+Seeds the benchmark dataset, submits one batch for every user with enough new
+messages, clears one of them through DELETE /api/data while the batch runs,
+polls until it ended and reports throughput and tokens as JSON:
+
+    python -m bench.batch --batch-delay 2
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+from bench.load import bench_config
+from bench.stub_jwks import StubIssuer
+from bench.stub_llm import StubConfig, start as start_llm
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reflektion batch analysis run")
+    parser.add_argument("--database-uri", default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-delay", type=float, default=1.0)
+    parser.add_argument("--min-new", type=int, default=5)
+    parser.add_argument("--output", help="write results json here")
+    args = parser.parse_args()
+
+    if args.database_uri is None:
+        tmp = tempfile.mkdtemp(prefix="reflektion-bench-")
+        args.database_uri = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    llm_config = StubConfig(ttft=0, batch_delay=args.batch_delay)
+    llm = start_llm(llm_config)
+
+    from bench.seed import DEFAULT_PROFILE, seed
+    from src.app import create_app
+
+    issuer = StubIssuer().start()
+    app = create_app(bench_config(args, issuer, f"http://127.0.0.1:{llm.server_port}"))
+    from src.batch import poll_analysis_batches, submit_analysis_batch
+    from src.models import Analysis
+
+    logging.getLogger("src").setLevel(logging.WARNING)
+
+    with app.app_context():
+        seed(DEFAULT_PROFILE, args.seed)
+
+        start = time.perf_counter()
+        batch = submit_analysis_batch(args.min_new)
+        submitted = time.perf_counter() - start
+        users = len(batch.items) if batch else 0
+
+        # the user deletes their data before the results are back
+        cleared = batch.items[0].user_id if batch else None
+        if cleared:
+            app.test_client().delete(
+                "/api/data",
+                headers={"Authorization": f"Bearer {issuer.mint(cleared)}"},
+            )
+        analyses_before = Analysis.query.count()
+
+        totals = {"applied": 0, "failed": 0, "skipped": 0}
+        while batch:
+            counts = poll_analysis_batches()
+            for result in totals:
+                totals[result] += counts[result]
+            if not counts["in_progress"]:
+                break
+            time.sleep(0.2)
+        elapsed = time.perf_counter() - start
+
+        report = {
+            "users": users,
+            "requests": llm_config.stats["batch_requests"],
+            "applied": totals["applied"],
+            "failed": totals["failed"],
+            "skipped": totals["skipped"],
+            "cleared_user_analyses": (
+                Analysis.query.filter_by(user_id=cleared).count() if cleared else 0
+            ),
+            "analyses_written": Analysis.query.count() - analyses_before,
+            "tokens": llm_config.stats["input_tokens"]
+            + llm_config.stats["output_tokens"],
+            "submit_seconds": round(submitted, 3),
+            "total_seconds": round(elapsed, 3),
+            "stub_batch_delay": args.batch_delay,
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# backend/bench/importtime.py
+
+"""
+Cold start cost of a worker.
+
+Runs `python -X importtime` in fresh interpreters for importing src.app and
+for building an app with create_app(), and reports the median total plus the
+slowest modules as JSON:
+
+    python -m bench.importtime --runs 5 --output importtime.json
+    python -m bench.importtime --baseline importtime.json  # exits 1 on regression
+"""
+
+from typing import Any
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+TARGETS = {
+    "import": "import src.app",
+    "create_app": "from src.app import create_app; create_app()",
+}
+
+
+def parse_importtime(stderr: str) -> dict[str, tuple[int, int]]:
+    # "import time: self [us] | cumulative | imported package"
+    modules: dict[str, tuple[int, int]] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|", 2)
+        modules[name.rstrip()[1:]] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_once(code: str, env: dict[str, str]) -> tuple[int, dict[str, tuple[int, int]]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = parse_importtime(result.stderr)
+    # top level imports are the ones without indentation
+    total = sum(c for name, (_, c) in modules.items() if not name.startswith(" "))
+    return total, modules
+
+
+def measure(code: str, runs: int, top: int, env: dict[str, str]) -> dict[str, Any]:
+    totals = []
+    cumulative: dict[str, list[int]] = {}
+    for _ in range(runs):
+        total, modules = run_once(code, env)
+        totals.append(total)
+        for name, (_, c) in modules.items():
+            cumulative.setdefault(name.strip(), []).append(c)
+
+    slowest = sorted(
+        ((name, statistics.median(values)) for name, values in cumulative.items()),
+        key=lambda kv: kv[1],
+        reverse=True,
+    )[:top]
+    return {
+        "median_ms": round(statistics.median(totals) / 1000, 1),
+        "min_ms": round(min(totals) / 1000, 1),
+        "max_ms": round(max(totals) / 1000, 1),
+        "slowest_modules_ms": {name: round(us / 1000, 1) for name, us in slowest},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reflektion cold start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="write results json here")
+    parser.add_argument("--baseline", help="results json to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    from cryptography.fernet import Fernet
+
+    tmp = tempfile.mkdtemp(prefix="reflektion-bench-")
+    env = dict(
+        os.environ,
+        ENCRYPTION_KEY=os.getenv("ENCRYPTION_KEY") or Fernet.generate_key().decode(),
+        DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+    )
+
+    results = {
+        name: measure(code, args.runs, args.top, env) for name, code in TARGETS.items()
+    }
+    for name, result in results.items():
+        print(f"{name:>10}: median {result['median_ms']}ms", file=sys.stderr)
+
+    output = json.dumps({"runs": args.runs, "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = [
+            f"{name}: {baseline[name]['median_ms']}ms -> {result['median_ms']}ms"
+            for name, result in results.items()
+            if name in baseline
+            and result["median_ms"] > baseline[name]["median_ms"] * (1 + args.tolerance)
+        ]
+        for line in regressions:
+            print(f"regression: {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+# backend/bench/load.py
+
+"""
+End to end load benchmark.
+
+Starts the stub LLM and JWKS servers, seeds a fresh database, serves the app
+in process and drives the main endpoints at a fixed concurrency. Results are
+written as JSON so runs can be compared:
+
+    python -m bench.load --concurrency 8 --requests 200 --output run.json
+    python -m bench.load --baseline run.json  # exits 1 on regression
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench.stub_jwks import StubIssuer
+from bench.stub_llm import StubConfig, start as start_llm
+
+QUERY_COUNT = re.compile(r'db_query;desc="(\d+)x"')
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    min_history: int = 0
+    body: Callable[[int], dict[str, Any]] | None = None
+
+
+SCENARIOS = [
+    Scenario(
+        "chat",
+        "POST",
+        "/api/chat",
+        body=lambda i: {"message": f"Benchmark check-in number {i}, how am I doing?"},
+    ),
+    Scenario("messages", "GET", "/api/messages"),
+    Scenario("analysis", "GET", "/api/analysis"),
+    Scenario("analyse", "POST", "/api/analyse", min_history=10),
+]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except Exception:
+        return None
+
+
+def bench_config(
+    args: argparse.Namespace, issuer: StubIssuer, llm_url: str
+) -> dict[str, Any]:
+    from cryptography.fernet import Fernet
+
+    return {
+        "SQLALCHEMY_DATABASE_URI": args.database_uri,
+        "ANTHROPIC_API_KEY": "bench",
+        "ANTHROPIC_BASE_URL": llm_url,
+        "CLERK_DOMAIN": issuer.url,
+        "ENCRYPTION_KEY": os.getenv("ENCRYPTION_KEY") or Fernet.generate_key().decode(),
+        "RATELIMIT_ENABLED": False,
+        "SERVER_TIMING": True,
+    }
+
+
+def serve_app(app: Any) -> tuple[Any, str]:
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def run_scenario(
+    scenario: Scenario,
+    base_url: str,
+    tokens: dict[str, str],
+    user_sizes: dict[str, int],
+    concurrency: int,
+    total: int,
+) -> dict[str, Any]:
+    import requests
+
+    users = [u for u, size in user_sizes.items() if size >= scenario.min_history]
+    latencies: list[float] = []
+    queries: list[int] = []
+    statuses: dict[str, int] = {}
+    lock = threading.Lock()
+    counter = iter(range(total))
+    local = threading.local()
+
+    def worker() -> None:
+        session = local.__dict__.setdefault("session", requests.Session())
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+
+            user_id = users[i % len(users)]
+            headers = {"Authorization": f"Bearer {tokens[user_id]}"}
+            body = scenario.body(i) if scenario.body else None
+
+            start = time.perf_counter()
+            response = session.request(
+                scenario.method, base_url + scenario.path, json=body, headers=headers
+            )
+            elapsed = time.perf_counter() - start
+
+            match = QUERY_COUNT.search(response.headers.get("Server-Timing", ""))
+            with lock:
+                latencies.append(elapsed)
+                statuses[str(response.status_code)] = (
+                    statuses.get(str(response.status_code), 0) + 1
+                )
+                if match:
+                    queries.append(int(match.group(1)))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - start
+
+    errors = sum(n for code, n in statuses.items() if not code.startswith("2"))
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status": statuses,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "mean": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0,
+            "max": round(max(latencies, default=0) * 1000, 2),
+        },
+        "queries_per_request": {
+            "mean": round(statistics.fmean(queries), 2) if queries else None,
+            "max": max(queries, default=None),
+        },
+    }
+
+
+def compare(
+    current: dict[str, Any], baseline: dict[str, Any], tolerance: float
+) -> list[str]:
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+
+        p95, old_p95 = result["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        if old_p95 and p95 > old_p95 * (1 + tolerance):
+            regressions.append(f"{name}: p95 {old_p95}ms -> {p95}ms")
+
+        rps, old_rps = result["throughput_rps"], before["throughput_rps"]
+        if old_rps and rps < old_rps * (1 - tolerance):
+            regressions.append(f"{name}: throughput {old_rps} -> {rps} req/s")
+
+        q, old_q = (
+            result["queries_per_request"]["mean"],
+            before["queries_per_request"]["mean"],
+        )
+        if q is not None and old_q is not None and q > old_q:
+            regressions.append(f"{name}: queries/request {old_q} -> {q}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reflektion load benchmark")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="per scenario")
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(s.name for s in SCENARIOS),
+        help="comma separated subset of " + ", ".join(s.name for s in SCENARIOS),
+    )
+    parser.add_argument(
+        "--database-uri",
+        default=None,
+        help="defaults to a fresh sqlite file, postgres urls work too",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tpot", type=float, default=0.002)
+    parser.add_argument("--output-tokens", type=int, default=120)
+    parser.add_argument("--output", help="write results json here")
+    parser.add_argument("--baseline", help="results json to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--verbose", action="store_true", help="keep app logs")
+    args = parser.parse_args()
+
+    if args.database_uri is None:
+        tmp = tempfile.mkdtemp(prefix="reflektion-bench-")
+        args.database_uri = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    llm_config = StubConfig(
+        ttft=args.ttft, tpot=args.tpot, output_tokens=args.output_tokens
+    )
+    llm = start_llm(llm_config)
+    issuer = StubIssuer().start()
+    from src.app import create_app
+
+    app = create_app(bench_config(args, issuer, f"http://127.0.0.1:{llm.server_port}"))
+    server, base_url = serve_app(app)
+    if not args.verbose:
+        logging.getLogger("src").setLevel(logging.WARNING)
+
+    from bench.seed import DEFAULT_PROFILE, seed, user_id_for
+
+    with app.app_context():
+        seed(DEFAULT_PROFILE, args.seed)
+    user_sizes = {
+        user_id_for(size, i): size
+        for size, count in DEFAULT_PROFILE.items()
+        for i in range(count)
+    }
+    tokens = {user_id: issuer.mint(user_id) for user_id in user_sizes}
+
+    wanted = set(args.scenarios.split(","))
+    results = {}
+    for scenario in SCENARIOS:
+        if scenario.name not in wanted:
+            continue
+
+        llm_before = dict(llm_config.stats)
+        result = run_scenario(
+            scenario, base_url, tokens, user_sizes, args.concurrency, args.requests
+        )
+        result["llm_calls"] = llm_config.stats["requests"] - llm_before["requests"]
+        result["llm_tokens"] = (
+            llm_config.stats["input_tokens"]
+            + llm_config.stats["output_tokens"]
+            - llm_before["input_tokens"]
+            - llm_before["output_tokens"]
+        )
+        results[scenario.name] = result
+        print(
+            f"{scenario.name:>10}: {result['throughput_rps']:>8} req/s  "
+            f"p50 {result['latency_ms']['p50']}ms  p95 {result['latency_ms']['p95']}ms  "
+            f"p99 {result['latency_ms']['p99']}ms  "
+            f"queries {result['queries_per_request']['mean']}  errors {result['errors']}",
+            file=sys.stderr,
+        )
+
+    server.shutdown()
+    report = {
+        "meta": {
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "database": args.database_uri.split(":", 1)[0],
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "seed": args.seed,
+            "stub": {
+                "ttft": args.ttft,
+                "tpot": args.tpot,
+                "output_tokens": args.output_tokens,
+            },
+            "jwks_fetches": issuer.requests,
+        },
+        "results": results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"regression: {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+# backend/bench/maintenance.py
+
+"""
+Throughput of the `flask maintenance` jobs.
+
+Seeds a fleet of users and rotates the encryption key three times: once with
+the per-user ORM loop these jobs used to need, then with `maintenance
+reencrypt` on one worker and on --workers. Also interrupts a run and resumes
+it, rebuilds the retrieval index, and purges stale accounts. Prints JSON with
+users/s per variant and the checks, exits 1 if a check failed:
+
+    python -m bench.maintenance --users 2000 --workers 4
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+
+from bench.load import bench_config
+from bench.stub_jwks import StubIssuer
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reflektion maintenance benchmark")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--database-uri", default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.database_uri is None:
+        tmp = tempfile.mkdtemp(prefix="reflektion-bench-")
+        args.database_uri = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    from cryptography.fernet import Fernet, InvalidToken
+
+    from bench.seed import seed
+    from src.app import create_app
+    from src.maintenance import (
+        ENCRYPTED_COLUMNS,
+        index_history,
+        load_encrypted,
+        load_histories,
+        load_stale,
+        rotate_row,
+        run_job,
+        store_encrypted,
+        store_indexes,
+        store_purge,
+        stale_users_query,
+    )
+    from src.config import FREE_TOKENS
+    from src.models import db, Context, MessageIndexBlock, StripeEvent, User
+    from src.retrieval import index_messages
+    from src.services import load_user_chat_history, save_context_to_db
+
+    issuer = StubIssuer().start()
+    app = create_app(bench_config(args, issuer, "http://127.0.0.1:9"))
+    logging.getLogger("src").setLevel(logging.ERROR)
+
+    # mostly short histories, like the real fleet
+    profile = {
+        0: args.users // 10,
+        10: args.users * 4 // 10,
+        50: args.users * 4 // 10,
+        200: args.users // 10,
+    }
+    started = time.perf_counter()
+    with app.app_context():
+        user_ids = seed(profile, args.seed)
+    results: dict[str, Any] = {
+        "users": len(user_ids),
+        "seed_s": round(time.perf_counter() - started, 1),
+    }
+    checks: dict[str, bool] = {}
+
+    keys = [app.config["ENCRYPTION_KEY"]]
+
+    def rotate_key() -> None:
+        keys.insert(0, Fernet.generate_key().decode())
+        app.config["ENCRYPTION_KEY"] = keys[0]
+        app.config["ENCRYPTION_OLD_KEYS"] = keys[1:]
+
+    def all_under_current_key() -> bool:
+        current = Fernet(keys[0].encode())
+        with app.app_context():
+            for model, columns in ENCRYPTED_COLUMNS.values():
+                for row in db.session.query(*(getattr(model, c) for c in columns)):
+                    for token in row:
+                        try:
+                            token and current.decrypt(token.encode())
+                        except InvalidToken:
+                            return False
+        return True
+
+    def throughput(name: str, seconds: float, rows: int) -> None:
+        results[name] = {
+            "seconds": round(seconds, 2),
+            "users_per_s": round(len(user_ids) / seconds),
+            "rows_per_s": round(rows / seconds),
+        }
+        print(f"{name:>16}: {results[name]['users_per_s']} users/s", file=sys.stderr)
+
+    # the loop an operator would have written before
+    rotate_key()
+    with app.app_context():
+        start = time.perf_counter()
+        rows = 0
+        for user in User.query.order_by(User.id):
+            if user.context:
+                user.context.messages = user.context.messages
+                rows += 1
+            if user.summary:
+                user.summary.summary = user.summary.summary
+                rows += 1
+            for analysis in user.analyses:
+                analysis.big_five_personality = analysis.big_five_personality
+                analysis.thinking_patterns = analysis.thinking_patterns
+                analysis.communication_style = analysis.communication_style
+                rows += 1
+            db.session.commit()
+        throughput("orm_loop", time.perf_counter() - start, rows)
+    checks["orm_loop_rotated"] = all_under_current_key()
+
+    for name, workers in (
+        ("reencrypt_1", 1),
+        (f"reencrypt_{args.workers}", args.workers),
+    ):
+        if name in results:
+            continue
+        rotate_key()
+        with app.app_context():
+            job = run_job(
+                "reencrypt",
+                load_encrypted,
+                rotate_row,
+                store_encrypted,
+                args.chunk_size,
+                workers,
+            )
+            throughput(name, job.seconds, job.rows)
+        checks[f"{name}_rotated"] = all_under_current_key()
+
+    # killed after three chunks, the rerun picks up after the last commit
+    rotate_key()
+    chunks = 0
+
+    def store_then_crash(rows: list[Any]) -> int:
+        nonlocal chunks
+        chunks += 1
+        if chunks > 3:
+            raise KeyboardInterrupt
+        return store_encrypted(rows)
+
+    with app.app_context():
+        try:
+            run_job("reencrypt", load_encrypted, rotate_row, store_then_crash, 100, 1)
+        except KeyboardInterrupt:
+            pass
+        job = run_job("reencrypt", load_encrypted, rotate_row, store_encrypted, 100, 1)
+        checks["resumed_once_through"] = job.users == len(user_ids)
+    checks["resumed_rotated"] = all_under_current_key()
+
+    # a chat turn between loading and storing a chunk must survive
+    rotate_key()
+    with app.app_context():
+        live = user_ids[-1]
+        users = [
+            (pk, live) for (pk,) in db.session.query(User.id).filter_by(user_id=live)
+        ]
+        rotated = [rotate_row(payload) for payload in load_encrypted(users)]
+        indexed = [index_history(payload) for payload in load_histories(users)]
+        # the chat route saves the turn, then indexes it
+        history = load_user_chat_history(live) + [
+            {"role": "user", "content": "live write"}
+        ]
+        save_context_to_db(live, history)
+        index_messages(live, history)
+        store_encrypted(rotated)
+        store_indexes(indexed)
+        db.session.commit()
+        checks["live_write_kept"] = (
+            load_user_chat_history(live)[-1]["content"] == "live write"
+        )
+        indexed_count = sum(
+            count
+            for (count,) in db.session.query(MessageIndexBlock.count).filter_by(
+                user_id=live
+            )
+        )
+        checks["live_index_kept"] = indexed_count == len(history)
+
+    with app.app_context():
+        sizes = {
+            user_id: len(messages)
+            for user_id, messages in (
+                (c.user_id, c.messages) for c in Context.query.all()
+            )
+        }
+        job = run_job(
+            "reindex",
+            load_histories,
+            index_history,
+            store_indexes,
+            args.chunk_size,
+            args.workers,
+        )
+        throughput("reindex", job.seconds, job.rows)
+        expected = sum(math.ceil(n / 1024) for n in sizes.values())
+        checks["reindex_blocks"] = MessageIndexBlock.query.count() == expected
+
+    # a tenth of the users went quiet two years ago
+    with app.app_context():
+        quiet = user_ids[1::10]
+        old = datetime.now(timezone.utc) - timedelta(days=730)
+        User.query.filter(User.user_id.in_(quiet)).update(
+            {"created_at": old, "tokens_available": FREE_TOKENS},
+            synchronize_session=False,
+        )
+        Context.query.filter(Context.user_id.in_(quiet)).update(
+            {"updated_at": old}, synchronize_session=False
+        )
+
+        # some of them paid, in every way that leaves a trace
+        legacy, purchased, pending = quiet[:3]
+        User.query.filter_by(user_id=legacy).update(
+            {"tokens_available": FREE_TOKENS + 1000}
+        )
+        User.query.filter_by(user_id=purchased).update(
+            {"tokens_available": 0, "tokens_purchased": 1000}
+        )
+        db.session.add(
+            StripeEvent(
+                event_id="evt_pending",
+                type="checkout.session.completed",
+                user_id=pending,
+            )  # type: ignore
+        )
+        db.session.commit()
+        cutoff = datetime.now(timezone.utc) - timedelta(days=365)
+
+        # loaded as stale, then bought tokens before the chunk was stored
+        late = quiet[3]
+        (pk,) = db.session.query(User.id).filter_by(user_id=late).one()
+        loaded = load_stale(cutoff)([(pk, late)])
+        db.session.add(
+            StripeEvent(
+                event_id="evt_late", type="checkout.session.completed", user_id=late
+            )  # type: ignore
+        )
+        db.session.commit()
+        store_purge(cutoff)(loaded)
+        db.session.commit()
+        checks["purge_rechecked"] = (
+            loaded == [late] and User.query.filter_by(user_id=late).count() == 1
+        )
+        stale = quiet[4:]
+
+        checks["purge_dry_run"] = stale_users_query(cutoff).count() == len(stale)
+        job = run_job(
+            "purge-stale",
+            load_stale(cutoff),
+            None,
+            store_purge(cutoff),
+            args.chunk_size,
+        )
+        remaining = {u for (u,) in db.session.query(User.user_id)}
+        checks["purged_stale_only"] = job.rows == len(stale) and remaining == set(
+            user_ids
+        ) - set(stale)
+        checks["purged_children"] = (
+            Context.query.filter(Context.user_id.in_(stale)).count() == 0
+        )
+
+    results["speedup_vs_orm_loop"] = round(
+        results[f"reencrypt_{args.workers}"]["users_per_s"]
+        / results["orm_loop"]["users_per_s"],
+        1,
+    )
+    results["cpus"] = os.cpu_count()
+    results["checks"] = checks
+    print(json.dumps(results, indent=2))
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
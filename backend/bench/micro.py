@@ -0,0 +1,184 @@
+# backend/bench/micro.py
+
+"""
+Micro benchmarks for the serialization and crypto hot paths in models.py.
+
+Sweeps payload sizes (number of messages, or analyses for to_dict) and runs
+every codec dependent target once per available JSON backend, reporting
+ops/sec and allocations per op:
+
+    python -m bench.micro --sizes 1,10,100,1000,10000 --output micro.json
+
+Install orjson to include it in the comparison.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Callable
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+if not os.getenv("ENCRYPTION_KEY"):
+    from cryptography.fernet import Fernet
+
+    os.environ["ENCRYPTION_KEY"] = Fernet.generate_key().decode()
+
+from bench.seed import make_history
+from src import codec
+from src.models import Analysis, Context, decrypt, encrypt
+from src.services import _clean_json_response
+
+
+def measure(op: Callable[[], Any], min_time: float) -> dict[str, float]:
+    # allocations of a single call
+    tracemalloc.start()
+    op()
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+
+    # grow the batch until it runs for at least min_time
+    runs = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(runs):
+            op()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        runs *= 2 if elapsed < min_time / 10 else 1 + math.ceil(min_time / elapsed)
+
+    return {
+        "ops_per_sec": round(runs / elapsed, 2),
+        "us_per_op": round(elapsed / runs * 1e6, 2),
+        "peak_kib": round(peak / 1024, 1),
+        "live_blocks": blocks,
+    }
+
+
+def make_analysis(rng: random.Random) -> Analysis:
+    analysis = Analysis(
+        id=1,
+        user_id="bench",
+        big_five_personality={
+            "openness": rng.uniform(0, 10),
+            "conscientiousness": rng.uniform(0, 10),
+            "extraversion": rng.uniform(0, 10),
+            "agreeableness": rng.uniform(0, 10),
+            "neuroticism": rng.uniform(0, 10),
+        },
+        thinking_patterns={
+            "cognitive_distortions": ["catastrophizing", "mind_reading"],
+            "problem_solving": rng.uniform(0, 10),
+            "certainty": rng.uniform(0, 10),
+            "agency": rng.uniform(0, 10),
+        },
+        communication_style={
+            "self_talk_tone": "critical",
+            "emotional_expression": "balanced",
+            "thought_complexity": "nuanced",
+        },
+    )  # type: ignore
+    analysis.timestamp = datetime.now(timezone.utc)  # type: ignore
+    return analysis
+
+
+def targets(size: int, rng: random.Random) -> dict[str, Callable[[], Any]]:
+    history = make_history(rng, size)
+    plaintext = codec.dumps(history)
+    ciphertext = encrypt(plaintext)
+    context = Context(user_id="bench", messages=history)  # type: ignore
+    analyses = [make_analysis(rng) for _ in range(size)]
+    response = "```json\n" + json.dumps({"items": history}) + "\n```"
+
+    def set_messages() -> None:
+        context.messages = history  # type: ignore
+
+    return {
+        "encrypt": lambda: encrypt(plaintext),
+        "decrypt": lambda: decrypt(ciphertext),
+        "context_get": lambda: context.messages,
+        "context_set": set_messages,
+        "analysis_to_dict": lambda: [a.to_dict() for a in analyses],
+        "clean_json_response": lambda: _clean_json_response(response),
+    }
+
+
+# targets that don't touch the codec only need to run once
+CODEC_INDEPENDENT = {"encrypt", "decrypt", "clean_json_response"}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reflektion micro benchmarks")
+    parser.add_argument("--sizes", default="1,10,100,1000,10000")
+    parser.add_argument(
+        "--backends",
+        default=",".join(codec.BACKENDS),
+        help="available: " + ", ".join(codec.BACKENDS),
+    )
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results json here")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    backends = [b for b in args.backends.split(",") if b in codec.BACKENDS]
+
+    results: dict[str, dict[str, dict[str, Any]]] = {}
+    for backend in backends:
+        codec.set_backend(backend)
+        for size in sizes:
+            for name, op in targets(size, random.Random(args.seed)).items():
+                if name in CODEC_INDEPENDENT and backend != backends[0]:
+                    continue
+                key = name if name in CODEC_INDEPENDENT else f"{name}[{backend}]"
+                stats = measure(op, args.min_time)
+                results.setdefault(key, {})[str(size)] = stats
+                print(
+                    f"{key:>28} n={size:<6} {stats['ops_per_sec']:>12} ops/s "
+                    f"{stats['peak_kib']:>10} KiB peak",
+                    file=sys.stderr,
+                )
+
+    # geometric mean speedup over stdlib json, per codec dependent target
+    recommendation: dict[str, Any] = {}
+    for backend in backends:
+        if backend == "json":
+            continue
+        ratios = []
+        for key, by_size in results.items():
+            if not key.endswith(f"[{backend}]"):
+                continue
+            baseline = results[key.replace(f"[{backend}]", "[json]")]
+            for size, stats in by_size.items():
+                ratios.append(stats["ops_per_sec"] / baseline[size]["ops_per_sec"])
+        if ratios:
+            recommendation[backend] = round(
+                math.exp(sum(math.log(r) for r in ratios) / len(ratios)), 3
+            )
+
+    best = max(recommendation.items(), key=lambda kv: kv[1], default=("json", 1.0))
+    report = {
+        "sizes": sizes,
+        "backends": backends,
+        "results": results,
+        "speedup_vs_json": recommendation,
+        "recommended_backend": best[0] if best[1] > 1.0 else "json",
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# backend/bench/overload.py
+
+"""
+Goodput under overload.
+
+The stub LLM gets a concurrency limit (429 beyond it, like an org rate limit)
+and more clients than it can serve hammer /api/chat, with some of them on
+/api/analyse. Runs once without admission control and once with LLM_SLOTS
+matching the stub's limit, and reports per endpoint how many requests got a
+real answer, a canned apology or a 503, as JSON:
+
+    python -m bench.overload --clients 24 --capacity 4 --duration 15
+
+Clients are closed loop and honour Retry-After.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from bench.load import bench_config, percentile, serve_app
+from bench.stub_jwks import StubIssuer
+from bench.stub_llm import StubConfig, start as start_llm
+
+APOLOGY = "Sorry, I couldn't generate a response right now."
+
+
+def run(args: argparse.Namespace, slots: int, issuer: StubIssuer) -> dict[str, Any]:
+    import requests
+
+    tmp = tempfile.mkdtemp(prefix="reflektion-bench-")
+    args.database_uri = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    llm_config = StubConfig(
+        ttft=args.ttft, tpot=0, output_tokens=50, max_concurrency=args.capacity
+    )
+    llm = start_llm(llm_config)
+
+    from bench.seed import DEFAULT_PROFILE, seed
+    from src.app import create_app
+
+    config = bench_config(args, issuer, f"http://127.0.0.1:{llm.server_port}")
+    config["LLM_SLOTS"] = slots
+    config["LLM_SLOTS_DIR"] = os.path.join(tmp, "slots")
+    app = create_app(config)
+    server, base_url = serve_app(app)
+    logging.getLogger("src").setLevel(logging.ERROR)
+
+    with app.app_context():
+        user_ids = [u for u in seed(DEFAULT_PROFILE, args.seed) if "_0_" not in u]
+    tokens = {user_id: issuer.mint(user_id) for user_id in user_ids}
+
+    # endpoint -> outcome -> count, and latencies of good answers
+    outcomes: dict[str, dict[str, int]] = {"chat": {}, "analyse": {}}
+    latencies: dict[str, list[float]] = {"chat": [], "analyse": []}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    def client(index: int) -> None:
+        session = requests.Session()
+        endpoint = "analyse" if index < args.clients * args.analyse_share else "chat"
+        user_id = user_ids[index % len(user_ids)]
+        headers = {"Authorization": f"Bearer {tokens[user_id]}"}
+        i = 0
+        while time.monotonic() < deadline:
+            body = (
+                {"message": f"check-in {i}"} if endpoint == "chat" else {"full": True}
+            )
+            start = time.perf_counter()
+            response = session.post(
+                f"{base_url}/api/{endpoint}", json=body, headers=headers
+            )
+            elapsed = time.perf_counter() - start
+            i += 1
+
+            if response.status_code == 503:
+                outcome = "rejected"
+            elif response.status_code != 200:
+                outcome = "failed"
+            elif endpoint == "chat" and response.json()["response"] == APOLOGY:
+                outcome = "apology"
+            else:
+                outcome = "good"
+            with lock:
+                outcomes[endpoint][outcome] = outcomes[endpoint].get(outcome, 0) + 1
+                if outcome == "good":
+                    latencies[endpoint].append(elapsed)
+
+            if outcome == "rejected":
+                time.sleep(min(float(response.headers.get("Retry-After", 1)), 5))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as pool:
+        list(pool.map(client, range(args.clients)))
+    wall = time.perf_counter() - start
+    server.shutdown()
+    llm.shutdown()
+
+    return {
+        "slots": slots,
+        "upstream_rate_limited": llm_config.stats["rate_limited"],
+        **{
+            endpoint: {
+                "outcomes": outcomes[endpoint],
+                "goodput_rps": round(outcomes[endpoint].get("good", 0) / wall, 2),
+                "good_p50_ms": round(percentile(latencies[endpoint], 50) * 1000, 1),
+                "good_p95_ms": round(percentile(latencies[endpoint], 95) * 1000, 1),
+            }
+            for endpoint in outcomes
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reflektion overload benchmark")
+    parser.add_argument("--clients", type=int, default=24)
+    parser.add_argument("--capacity", type=int, default=4, help="stub llm limit")
+    parser.add_argument("--ttft", type=float, default=0.5)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--analyse-share", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results json here")
+    args = parser.parse_args()
+
+    issuer = StubIssuer().start()
+
+    results = {}
+    for name, slots in (("unlimited", 0), ("admission", args.capacity)):
+        results[name] = run(args, slots, issuer)
+        print(
+            f"{name:>10}: chat goodput {results[name]['chat']['goodput_rps']} req/s  "
+            f"analyse goodput {results[name]['analyse']['goodput_rps']} req/s  "
+            f"upstream 429s {results[name]['upstream_rate_limited']}",
+            file=sys.stderr,
+        )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
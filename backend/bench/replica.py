@@ -0,0 +1,153 @@
+# backend/bench/replica.py
+
+"""
+Read replica routing against two local databases.
+
+Seeds a primary, copies it into a replica, then checks that the read-only
+endpoints are served by the replica, that a user's reads go to the primary
+right after their own write, also in another worker process, and that reads
+fail over to the primary when the replica breaks. Prints the checks as JSON and exits 1 if any failed:
+
+    python -m bench.replica
+    python -m bench.replica --database-uri postgresql://localhost/reflektion \\
+        --replica-uri postgresql://localhost/reflektion_replica
+"""
+
+from multiprocessing import get_context
+from typing import Any
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+
+from bench.load import bench_config
+from bench.stub_jwks import StubIssuer
+from bench.stub_llm import StubConfig, start as start_llm
+
+READ_PATHS = ["/api/messages", "/api/analysis", "/api/summary", "/api/usage"]
+
+
+def copy_database(primary_uri: str, replica_uri: str) -> None:
+    # stands in for replication, sqlite only
+    source = sqlite3.connect(primary_uri.removeprefix("sqlite:///"))
+    target = sqlite3.connect(replica_uri.removeprefix("sqlite:///"))
+    source.backup(target)
+    source.close()
+    target.close()
+
+
+# a fresh process stands in for another gunicorn worker, returns the second
+# to last message and how many reads went to the primary for a recent write
+def read_in_other_worker(config: dict[str, Any], token: str) -> tuple[str, float]:
+    from src.app import create_app
+    from src.metrics import DB_READS
+
+    app = create_app(config)
+    logging.getLogger("src").setLevel(logging.ERROR)
+    response = app.test_client().get(
+        "/api/messages", headers={"Authorization": f"Bearer {token}"}
+    )
+    messages = response.get_json()["messages"]
+    return messages[-2]["content"], DB_READS._values.get(("primary", "recent_write"), 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reflektion read replica check")
+    parser.add_argument("--database-uri", default=None)
+    parser.add_argument("--replica-uri", default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.database_uri is None:
+        tmp = tempfile.mkdtemp(prefix="reflektion-bench-")
+        args.database_uri = f"sqlite:///{os.path.join(tmp, 'primary.db')}"
+        args.replica_uri = f"sqlite:///{os.path.join(tmp, 'replica.db')}"
+    sqlite = args.replica_uri.startswith("sqlite")
+
+    issuer = StubIssuer().start()
+    llm = start_llm(StubConfig(ttft=0))
+
+    from bench.seed import DEFAULT_PROFILE, seed
+    from src.app import create_app
+
+    config = bench_config(args, issuer, f"http://127.0.0.1:{llm.server_port}")
+    config["REPLICA_DATABASE_URI"] = args.replica_uri
+    app = create_app(config)
+    from src.metrics import DB_READS
+    from src.models import db
+
+    logging.getLogger("src").setLevel(logging.ERROR)
+
+    with app.app_context():
+        user_ids = seed(DEFAULT_PROFILE, args.seed)
+    if sqlite:
+        copy_database(args.database_uri, args.replica_uri)
+
+    def reads(target: str, reason: str) -> float:
+        return DB_READS._values.get((target, reason), 0)
+
+    client = app.test_client()
+    checks: dict[str, bool] = {}
+
+    # every read endpoint from the replica
+    before = reads("replica", "healthy")
+    statuses = set()
+    for user_id in user_ids[:5]:
+        headers = {"Authorization": f"Bearer {issuer.mint(user_id)}"}
+        for path in READ_PATHS:
+            statuses.add(client.get(path, headers=headers).status_code)
+    checks["reads_ok"] = statuses == {200}
+    checks["reads_from_replica"] = reads("replica", "healthy") - before == 5 * len(
+        READ_PATHS
+    )
+
+    # the replica never sees this write, the user's next read must
+    writer = user_ids[-1]
+    headers = {"Authorization": f"Bearer {issuer.mint(writer)}"}
+    client.post("/api/chat", json={"message": "a brand new message"}, headers=headers)
+    before = reads("primary", "recent_write")
+    messages = client.get("/api/messages", headers=headers).get_json()["messages"]
+    checks["read_your_writes"] = (
+        messages[-2]["content"] == "a brand new message"
+        and reads("primary", "recent_write") - before == 1
+    )
+    with get_context("spawn").Pool(1) as pool:
+        content, recent = pool.apply(
+            read_in_other_worker, (config, issuer.mint(writer))
+        )
+    checks["read_your_writes_other_worker"] = (
+        content == "a brand new message" and recent == 1
+    )
+
+    # other users keep reading from the replica
+    other = {"Authorization": f"Bearer {issuer.mint(user_ids[-2])}"}
+    before = reads("replica", "healthy")
+    client.get("/api/messages", headers=other)
+    checks["others_still_on_replica"] = reads("replica", "healthy") - before == 1
+
+    if sqlite:
+        # break the replica, the request still succeeds from the primary
+        with open(args.replica_uri.removeprefix("sqlite:///"), "r+b") as f:
+            f.write(b"not a database" * 8)
+        with app.app_context():
+            db.engines["replica"].dispose()
+
+        before = reads("primary", "failover")
+        response = client.get("/api/messages", headers=other)
+        checks["failover_ok"] = response.status_code == 200
+        checks["failover_counted"] = reads("primary", "failover") - before == 1
+
+        before = reads("primary", "unhealthy")
+        client.get("/api/usage", headers=other)
+        checks["unhealthy_skipped"] = reads("primary", "unhealthy") - before == 1
+
+    print(json.dumps(checks, indent=2))
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
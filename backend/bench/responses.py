@@ -0,0 +1,132 @@
+# backend/bench/responses.py
+
+"""
+Response size and server CPU for the large read endpoints.
+
+Seeds a small, a medium and a large account and fetches /api/messages and
+/api/analysis in-process with every JSON backend and every content encoding
+available here. Reports bytes on the wire and CPU milliseconds per request,
+and checks that every variant decodes to the same document. Prints JSON:
+
+    python -m bench.responses --requests 30
+
+json with identity encoding is byte for byte what the endpoints returned
+before the codec provider, compression and streaming.
+"""
+
+from typing import Any
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from bench.load import bench_config
+from bench.stub_jwks import StubIssuer
+
+SIZES = {"small": 10, "medium": 200, "large": 5000}
+PATHS = ["/api/messages", "/api/analysis"]
+
+
+def decode(body: bytes, encoding: str) -> Any:
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    elif encoding == "br":
+        import brotli
+
+        body = brotli.decompress(body)
+    return json.loads(body)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reflektion response benchmark")
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--database-uri", default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.database_uri is None:
+        tmp = tempfile.mkdtemp(prefix="reflektion-bench-")
+        args.database_uri = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    from bench.seed import seed, user_id_for
+    from src import codec
+    from src.app import create_app
+    from src.responses import brotli
+
+    issuer = StubIssuer().start()
+    config = bench_config(args, issuer, "http://127.0.0.1:9")
+    config["SERVER_TIMING"] = False
+    app = create_app(config)
+    logging.getLogger("src").setLevel(logging.ERROR)
+
+    with app.app_context():
+        seed({size: 1 for size in SIZES.values()}, args.seed)
+
+    backends = list(codec.BACKENDS)
+    encodings = ["identity", "gzip"] + (["br"] if brotli is not None else [])
+    client = app.test_client()
+    results: dict[str, Any] = {}
+    documents: dict[tuple[str, str], Any] = {}
+    consistent = True
+
+    for account, size in SIZES.items():
+        token = issuer.mint(user_id_for(size, 0))
+        for path in PATHS:
+            for backend in backends:
+                codec.set_backend(backend)
+                for encoding in encodings:
+                    headers = {
+                        "Authorization": f"Bearer {token}",
+                        "Accept-Encoding": encoding,
+                    }
+                    client.get(path, headers=headers)  # warm up
+
+                    cpu = time.process_time()
+                    for _ in range(args.requests):
+                        response = client.get(path, headers=headers)
+                        # the test client wraps every body in an iterator
+                        streamed = "Content-Length" not in response.headers
+                        body = response.get_data()  # drains streamed bodies
+                    cpu = (time.process_time() - cpu) / args.requests
+
+                    sent = response.headers.get("Content-Encoding", "identity")
+                    document = decode(body, sent)
+                    expected = documents.setdefault((account, path), document)
+                    consistent = consistent and document == expected
+                    if backend == "json" and encoding == "identity":
+                        # what flask's default provider would have sent
+                        stock = json.dumps(
+                            document, sort_keys=True, separators=(",", ":")
+                        )
+                        consistent = consistent and body == stock.encode() + b"\n"
+
+                    results.setdefault(account, {}).setdefault(path, {})[
+                        f"{backend}/{encoding}"
+                    ] = {
+                        "bytes": len(body),
+                        "cpu_ms": round(cpu * 1000, 2),
+                        "streamed": streamed,
+                    }
+
+        row = results[account]["/api/messages"]
+        print(
+            f"{account:>7} messages: "
+            + "  ".join(f"{k} {v['bytes']}B {v['cpu_ms']}ms" for k, v in row.items()),
+            file=sys.stderr,
+        )
+
+    codec.set_backend("json")
+    results["backends"] = backends
+    results["encodings"] = encodings
+    results["consistent"] = consistent
+    print(json.dumps(results, indent=2))
+    if not consistent:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# backend/bench/retrieval.py
+
+"""
+Retrieval index latency at large history sizes.
+
+For each size, indexes one user's history, then measures incremental appends
+(one message per call, like /api/chat) and top-k searches over everything
+outside the chat window (the first one with a cold block cache), and reports
+percentiles and storage as JSON:
+
+    python -m bench.retrieval --sizes 10000,100000
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from bench.load import bench_config
+from bench.stub_jwks import StubIssuer
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "p50": round(statistics.median(ordered) * 1000, 2),
+        "p95": round(ordered[int(len(ordered) * 0.95) - 1] * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reflektion retrieval latency")
+    parser.add_argument("--database-uri", default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--appends", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--output", help="write results json here")
+    args = parser.parse_args()
+
+    if args.database_uri is None:
+        tmp = tempfile.mkdtemp(prefix="reflektion-bench-")
+        args.database_uri = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    from bench.seed import make_history
+    from src.app import create_app
+
+    # no llm calls, the url is never used
+    app = create_app(bench_config(args, StubIssuer().start(), "http://127.0.0.1:9"))
+    from src.config import CHAT_WINDOW
+    from src.models import db, MessageIndexBlock, User
+    from src.retrieval import index_messages, retrieve_exchanges
+
+    logging.getLogger("src").setLevel(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    results = {}
+    with app.app_context():
+        for size in [int(s) for s in args.sizes.split(",")]:
+            user_id = f"bench_retrieval_{size}"
+            db.session.add(User(user_id=user_id))  # type: ignore
+            db.session.commit()
+            history = make_history(rng, size)
+
+            start = time.perf_counter()
+            index_messages(user_id, history[: size - args.appends])
+            build = time.perf_counter() - start
+
+            appends = []
+            for end in range(size - args.appends + 1, size + 1):
+                start = time.perf_counter()
+                index_messages(user_id, history[:end])
+                appends.append(time.perf_counter() - start)
+
+            # nothing of this user is in the block cache yet
+            start = time.perf_counter()
+            retrieve_exchanges(
+                user_id, history[0]["content"], history, size - CHAT_WINDOW
+            )
+            first_search = time.perf_counter() - start
+
+            searches = []
+            for _ in range(args.queries):
+                query = rng.choice(history)["content"]
+                start = time.perf_counter()
+                retrieve_exchanges(user_id, query, history, size - CHAT_WINDOW)
+                searches.append(time.perf_counter() - start)
+
+            blocks = MessageIndexBlock.query.filter_by(user_id=user_id).all()
+            results[str(size)] = {
+                "build_seconds": round(build, 3),
+                "append_ms": percentiles(appends),
+                "first_search_ms": round(first_search * 1000, 2),
+                "search_ms": percentiles(searches),
+                "blocks": len(blocks),
+                "stored_bytes": sum(len(b.vectors_encrypted) for b in blocks),
+            }
+            print(
+                f"{size:>8}: search p50 {results[str(size)]['search_ms']['p50']}ms"
+                f"  append p50 {results[str(size)]['append_ms']['p50']}ms",
+                file=sys.stderr,
+            )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# backend/bench/seed.py
+
+"""
+Deterministic benchmark dataset.
+
+Creates users with varied history sizes, each with a summary and a few
+analyses, against whatever DATABASE_URI the app is configured with.
+"""
+
+from datetime import datetime, timedelta, timezone
+import random
+
+# history size (messages) -> number of users
+DEFAULT_PROFILE = {0: 2, 10: 4, 50: 4, 200: 2, 1000: 1}
+
+WORDS = (
+    "work sleep friend anxious tired excited family deadline walk talk "
+    "decision worry progress stuck plan weekend partner boss change habit"
+).split()
+
+
+def user_id_for(size: int, index: int) -> str:
+    return f"bench_{size}_{index}"
+
+
+def _sentence(rng: random.Random, length: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+
+def make_history(rng: random.Random, size: int) -> list[dict[str, str]]:
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    history = []
+    for i in range(size):
+        role = "user" if i % 2 == 0 else "assistant"
+        length = rng.randint(5, 40) if role == "user" else rng.randint(20, 120)
+        history.append(
+            {
+                "role": role,
+                "content": _sentence(rng, length),
+                "timestamp": (start + timedelta(minutes=5 * i)).isoformat(),
+            }
+        )
+    return history
+
+
+def seed(profile: dict[int, int] | None = None, seed: int = 42) -> list[str]:
+    """Insert the dataset, must be called inside an app context."""
+    from src.models import db, User, Context, Analysis, Summary
+
+    rng = random.Random(seed)
+    user_ids = []
+    for size, count in sorted((profile or DEFAULT_PROFILE).items()):
+        for index in range(count):
+            user_id = user_id_for(size, index)
+            user_ids.append(user_id)
+
+            # plenty of tokens so the limit never kicks in mid run
+            db.session.add(User(user_id=user_id, tokens_available=10**9))  # type: ignore
+            if size:
+                db.session.add(
+                    Context(user_id=user_id, messages=make_history(rng, size))  # type: ignore
+                )
+                db.session.add(
+                    Summary(user_id=user_id, summary=_sentence(rng, 300))  # type: ignore
+                )
+                for _ in range(min(size // 10, 5)):
+                    db.session.add(
+                        Analysis(
+                            user_id=user_id,
+                            big_five_personality={
+                                "openness": rng.uniform(0, 10),
+                                "conscientiousness": rng.uniform(0, 10),
+                                "extraversion": rng.uniform(0, 10),
+                                "agreeableness": rng.uniform(0, 10),
+                                "neuroticism": rng.uniform(0, 10),
+                            },
+                            thinking_patterns={"problem_solving": rng.uniform(0, 10)},
+                            communication_style={"self_talk_tone": "neutral"},
+                        )  # type: ignore
+                    )
+        db.session.commit()
+
+    return user_ids
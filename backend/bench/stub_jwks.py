@@ -0,0 +1,71 @@
+# backend/bench/stub_jwks.py
+
+"""
+Fake Clerk issuer for benchmarks.
+
+Serves a JWKS document at /.well-known/jwks.json and mints RS256 tokens that
+src.auth.get_user_id accepts when CLERK_DOMAIN points at this server.
+"""
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+import json
+import threading
+import time
+import jwt
+
+KID = "bench-key"
+
+
+class StubIssuer:
+    def __init__(self) -> None:
+        self.private_key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048
+        )
+        jwk = json.loads(
+            jwt.algorithms.RSAAlgorithm.to_jwk(self.private_key.public_key())
+        )
+        jwk.update({"kid": KID, "alg": "RS256", "use": "sig"})
+        self.jwks = {"keys": [jwk]}
+        self.server: ThreadingHTTPServer | None = None
+        self.requests = 0
+
+    @property
+    def url(self) -> str:
+        assert self.server is not None
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def mint(self, user_id: str, lifetime: int = 24 * 3600) -> str:
+        now = int(time.time())
+        claims = {"sub": user_id, "iat": now, "nbf": now, "exp": now + lifetime}
+        return jwt.encode(
+            claims, self.private_key, algorithm="RS256", headers={"kid": KID}
+        )
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "StubIssuer":
+        issuer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                if self.path != "/.well-known/jwks.json":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                issuer.requests += 1
+                data = json.dumps(issuer.jwks).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
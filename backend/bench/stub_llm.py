@@ -0,0 +1,368 @@
+# backend/bench/stub_llm.py
+
+"""
+Fake Anthropic Messages endpoint for benchmarks.
+
+Supports POST /v1/messages with and without streaming. Latency is split into
+time to first token and time per output token so both shapes of slowness can
+be simulated. GET /stats returns request and token counts.
+
+With --max-concurrency, requests beyond that many in flight get a 429
+rate_limit_error, like an org limit would.
+
+The Message Batches endpoints are stubbed too: a batch stays in progress for
+--batch-delay seconds and its results are then served as JSONL.
+
+    python -m bench.stub_llm --port 8100 --ttft 0.3 --tpot 0.01 --output-tokens 200
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+import argparse
+import json
+import threading
+import time
+import uuid
+
+# canned answers so the analysis json parsing succeeds
+JSON_ANSWERS = {
+    "Big Five": {
+        "openness": 7.5,
+        "conscientiousness": 6.0,
+        "extraversion": 4.5,
+        "agreeableness": 7.0,
+        "neuroticism": 5.5,
+    },
+    "thinking patterns": {
+        "cognitive_distortions": ["catastrophizing"],
+        "problem_solving": 6.0,
+        "certainty": 5.0,
+        "agency": 6.5,
+    },
+    "communication and self-talk": {
+        "self_talk_tone": "neutral",
+        "emotional_expression": "balanced",
+        "thought_complexity": "nuanced",
+    },
+}
+
+FILLER = "reflection "
+
+
+@dataclass
+class StubConfig:
+    ttft: float = 0.2  # seconds before the first token
+    tpot: float = 0.0  # seconds per output token
+    output_tokens: int = 120
+    batch_delay: float = 0.0  # seconds a batch stays in progress
+    max_concurrency: int = 0  # like an org rate limit, 429 beyond it, 0 is unlimited
+    active: int = 0
+    batches: dict[str, dict[str, Any]] = field(default_factory=dict)
+    stats: dict[str, int] = field(
+        default_factory=lambda: {
+            "requests": 0,
+            "streamed": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "batches": 0,
+            "batch_requests": 0,
+            "rate_limited": 0,
+        }
+    )
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def count(self, **amounts: int) -> None:
+        with self.lock:
+            for key, value in amounts.items():
+                self.stats[key] = self.stats.get(key, 0) + value
+
+
+def _prompt_text(body: dict[str, Any]) -> str:
+    parts = [str(body.get("system", ""))]
+    for message in body.get("messages", []):
+        content = message.get("content", "")
+        if isinstance(content, list):
+            content = " ".join(block.get("text", "") for block in content)
+        parts.append(content)
+    return "\n".join(parts)
+
+
+def _answer(prompt: str, output_tokens: int) -> tuple[str, int]:
+    for marker, answer in JSON_ANSWERS.items():
+        if f"determine the user's {marker}" in prompt:
+            text = json.dumps(answer)
+            return text, max(len(text) // 4, 1)
+    return (FILLER * output_tokens).strip(), output_tokens
+
+
+def make_message(body: dict[str, Any], config: StubConfig) -> dict[str, Any]:
+    prompt = _prompt_text(body)
+    text, output_tokens = _answer(prompt, config.output_tokens)
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "stub"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": max(len(prompt) // 4, 1),
+            "output_tokens": output_tokens,
+        },
+    }
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def batch_status(batch: dict[str, Any], config: StubConfig, base_url: str) -> dict:
+    ended = time.time() >= batch["created"] + config.batch_delay
+    total = len(batch["results"])
+    return {
+        "id": batch["id"],
+        "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": {
+            "processing": 0 if ended else total,
+            "succeeded": total if ended else 0,
+            "errored": 0,
+            "canceled": 0,
+            "expired": 0,
+        },
+        "created_at": _iso(batch["created"]),
+        "expires_at": _iso(batch["created"] + 24 * 3600),
+        "ended_at": _iso(batch["created"] + config.batch_delay) if ended else None,
+        "archived_at": None,
+        "cancel_initiated_at": None,
+        "results_url": (
+            f"{base_url}/v1/messages/batches/{batch['id']}/results" if ended else None
+        ),
+    }
+
+
+def make_handler(config: StubConfig) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def _send_json(self, payload: Any, status: int = 200) -> None:
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_json(self) -> dict[str, Any]:
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _event(self, name: str, payload: dict[str, Any]) -> None:
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(payload)}\n\n".encode())
+            self.wfile.flush()
+
+        def _stream(self, message: dict[str, Any]) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+
+            usage = message["usage"]
+            start = dict(message, content=[], stop_reason=None)
+            start["usage"] = {"input_tokens": usage["input_tokens"], "output_tokens": 1}
+            self._event("message_start", {"type": "message_start", "message": start})
+            self._event(
+                "content_block_start",
+                {
+                    "type": "content_block_start",
+                    "index": 0,
+                    "content_block": {"type": "text", "text": ""},
+                },
+            )
+
+            # one delta per word, spread over the output tokens
+            words = message["content"][0]["text"].split(" ")
+            delay = config.tpot * usage["output_tokens"] / max(len(words), 1)
+            for i, word in enumerate(words):
+                if i and delay:
+                    time.sleep(delay)
+                self._event(
+                    "content_block_delta",
+                    {
+                        "type": "content_block_delta",
+                        "index": 0,
+                        "delta": {
+                            "type": "text_delta",
+                            "text": word if i == 0 else " " + word,
+                        },
+                    },
+                )
+
+            self._event(
+                "content_block_stop", {"type": "content_block_stop", "index": 0}
+            )
+            self._event(
+                "message_delta",
+                {
+                    "type": "message_delta",
+                    "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                    "usage": {"output_tokens": usage["output_tokens"]},
+                },
+            )
+            self._event("message_stop", {"type": "message_stop"})
+
+        @property
+        def base_url(self) -> str:
+            host, port = self.server.server_address[:2]
+            return f"http://{host}:{port}"
+
+        def _create_batch(self) -> None:
+            body = self._read_json()
+            batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+            results = []
+            for request in body.get("requests", []):
+                message = make_message(request["params"], config)
+                config.count(
+                    batch_requests=1,
+                    input_tokens=message["usage"]["input_tokens"],
+                    output_tokens=message["usage"]["output_tokens"],
+                )
+                results.append(
+                    {
+                        "custom_id": request["custom_id"],
+                        "result": {"type": "succeeded", "message": message},
+                    }
+                )
+
+            batch = {"id": batch_id, "created": time.time(), "results": results}
+            with config.lock:
+                config.batches[batch_id] = batch
+                config.stats["batches"] += 1
+            self._send_json(batch_status(batch, config, self.base_url))
+
+        def _get_batch(self, path: str) -> None:
+            parts = path.split("/")  # ["", "v1", "messages", "batches", id, ...]
+            batch = config.batches.get(parts[4]) if len(parts) > 4 else None
+            if batch is None:
+                self._send_json({"error": "not found"}, 404)
+                return
+
+            if len(parts) == 6 and parts[5] == "results":
+                data = "\n".join(json.dumps(r) for r in batch["results"]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/binary")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+
+            self._send_json(batch_status(batch, config, self.base_url))
+
+        def do_GET(self) -> None:
+            path = self.path.split("?")[0]
+            if path == "/stats":
+                with config.lock:
+                    self._send_json(dict(config.stats))
+                return
+            if path.startswith("/v1/messages/batches/"):
+                self._get_batch(path)
+                return
+            self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self) -> None:
+            path = self.path.split("?")[0]
+            if path == "/v1/messages/batches":
+                self._create_batch()
+                return
+            if path != "/v1/messages":
+                self._send_json({"error": "not found"}, 404)
+                return
+
+            body = self._read_json()
+            with config.lock:
+                limited = 0 < config.max_concurrency <= config.active
+                if not limited:
+                    config.active += 1
+            if limited:
+                config.count(rate_limited=1)
+                self.send_response(429)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("retry-after", "1")
+                data = json.dumps(
+                    {
+                        "type": "error",
+                        "error": {
+                            "type": "rate_limit_error",
+                            "message": "Number of concurrent requests exceeded",
+                        },
+                    }
+                ).encode()
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+
+            try:
+                self._respond(body)
+            finally:
+                with config.lock:
+                    config.active -= 1
+
+        def _respond(self, body: dict[str, Any]) -> None:
+            message = make_message(body, config)
+            usage = message["usage"]
+            config.count(
+                requests=1,
+                streamed=int(bool(body.get("stream"))),
+                input_tokens=usage["input_tokens"],
+                output_tokens=usage["output_tokens"],
+            )
+
+            time.sleep(config.ttft)
+            if body.get("stream"):
+                self._stream(message)
+            else:
+                time.sleep(config.tpot * usage["output_tokens"])
+                self._send_json(message)
+
+    return Handler
+
+
+def start(
+    config: StubConfig, host: str = "127.0.0.1", port: int = 0
+) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Anthropic Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tpot", type=float, default=0.0)
+    parser.add_argument("--output-tokens", type=int, default=120)
+    parser.add_argument("--batch-delay", type=float, default=0.0)
+    parser.add_argument("--max-concurrency", type=int, default=0)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        ttft=args.ttft,
+        tpot=args.tpot,
+        output_tokens=args.output_tokens,
+        batch_delay=args.batch_delay,
+        max_concurrency=args.max_concurrency,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"stub llm listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# backend/bench/summary.py
+
+"""
+Summary update cost as an account ages.
+
+Grows one user's history a segment at a time, runs update_user_summary after
+each step like /api/chat does, and reports the LLM calls and input tokens per
+update at a few history lengths as JSON:
+
+    python -m bench.summary --messages 2000
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+
+from bench.load import bench_config
+from bench.stub_jwks import StubIssuer
+from bench.stub_llm import StubConfig, start as start_llm
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reflektion summary update cost")
+    parser.add_argument("--database-uri", default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--output", help="write results json here")
+    args = parser.parse_args()
+
+    if args.database_uri is None:
+        tmp = tempfile.mkdtemp(prefix="reflektion-bench-")
+        args.database_uri = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    llm_config = StubConfig(ttft=0, tpot=0, output_tokens=150)
+    llm = start_llm(llm_config)
+
+    from bench.seed import make_history
+    from src.app import create_app
+
+    app = create_app(
+        bench_config(args, StubIssuer().start(), f"http://127.0.0.1:{llm.server_port}")
+    )
+    from src.ai import analysis_ai
+    from src.config import SUMMARY_SEGMENT_SIZE
+    from src.models import SummarySegment
+    from src.services import save_context_to_db, update_user_summary
+
+    logging.getLogger("src").setLevel(logging.WARNING)
+
+    user_id = "bench_summary"
+    history = make_history(random.Random(args.seed), args.messages)
+    # history length -> (llm calls, input tokens) of the update at that length
+    updates: dict[int, tuple[int, int]] = {}
+
+    with app.app_context():
+        for end in range(SUMMARY_SEGMENT_SIZE, args.messages + 1, SUMMARY_SEGMENT_SIZE):
+            save_context_to_db(user_id, history[:end])
+            calls = llm_config.stats["requests"]
+            input_tokens = llm_config.stats["input_tokens"]
+            update_user_summary(user_id, analysis_ai)
+            updates[end] = (
+                llm_config.stats["requests"] - calls,
+                llm_config.stats["input_tokens"] - input_tokens,
+            )
+
+        tiers = {
+            "segments": SummarySegment.query.filter_by(
+                user_id=user_id, level=SummarySegment.SEGMENT
+            ).count(),
+            "periods": SummarySegment.query.filter_by(
+                user_id=user_id, level=SummarySegment.PERIOD
+            ).count(),
+        }
+
+    checkpoints = sorted(
+        {n for n in (100, 500, 1000, 2000, args.messages) if n in updates}
+    )
+    tokens = [t for _, t in updates.values()]
+    report = {
+        "messages": args.messages,
+        "updates": len(updates),
+        "tiers": tiers,
+        "input_tokens_per_update": {
+            "median": statistics.median(tokens),
+            "max": max(tokens),
+            # the window of updates ending at each checkpoint, should stay flat
+            **{
+                str(n): round(
+                    statistics.mean(updates[m][1] for m in updates if n - 100 < m <= n)
+                )
+                for n in checkpoints
+            },
+        },
+        "llm_calls_per_update": round(
+            sum(c for c, _ in updates.values()) / len(updates), 2
+        ),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# backend/bench/webhook.py
+
+"""
+Stripe webhook delivery against a local server.
+
+Builds fake checkout.session.completed events, signs them with a local
+webhook secret the way Stripe does, and posts every event several times from
+concurrent clients, like Stripe's retries. Reports how fast deliveries were
+acknowledged and checks that each purchase was credited exactly once, also
+after `flask billing replay`, and that an event a failed apply left pending is
+credited by the next delivery. Prints JSON and exits 1 if a check failed:
+
+    python -m bench.webhook --events 200 --duplicates 3 --concurrency 16
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bench.load import bench_config, percentile, serve_app
+from bench.stub_jwks import StubIssuer
+
+SECRET = "whsec_bench"
+
+
+def fake_checkout_event(
+    event_id: str, user_id: str, package: str, tokens: int
+) -> dict[str, Any]:
+    return {
+        "id": event_id,
+        "object": "event",
+        "type": "checkout.session.completed",
+        "created": int(time.time()),
+        "livemode": False,
+        "data": {
+            "object": {
+                "id": f"cs_test_{event_id}",
+                "object": "checkout.session",
+                "client_reference_id": user_id,
+                "payment_status": "paid",
+                "metadata": {"user_id": user_id, "package": package, "tokens": tokens},
+            }
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reflektion webhook benchmark")
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--duplicates", type=int, default=3, help="sends per event")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--database-uri", default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.database_uri is None:
+        tmp = tempfile.mkdtemp(prefix="reflektion-bench-")
+        args.database_uri = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    import requests
+
+    from src.app import create_app
+    from src.billing import sign_payload
+    from src.config import FREE_TOKENS, TOKEN_PACKAGES
+    from src.models import db, StripeEvent, User
+    from src.services import get_or_create_user
+
+    issuer = StubIssuer().start()
+    config = bench_config(args, issuer, "http://127.0.0.1:9")
+    config["STRIPE_WEBHOOK_SECRET"] = SECRET
+    app = create_app(config)
+    server, base_url = serve_app(app)
+    logging.getLogger("src").setLevel(logging.ERROR)
+    url = f"{base_url}/api/stripe-webhook"
+
+    def balances() -> dict[str, int]:
+        with app.app_context():
+            return {
+                user_id: tokens
+                for user_id, tokens in db.session.query(
+                    User.user_id, User.tokens_available
+                )
+            }
+
+    rng = random.Random(args.seed)
+    user_ids = [f"webhook_user_{i}" for i in range(args.users)]
+    with app.app_context():
+        for user_id in user_ids[: args.users // 2]:  # the rest buy before signing in
+            get_or_create_user(user_id)
+    start_balances = balances()
+
+    events = []
+    for i in range(args.events):
+        package = rng.choice(list(TOKEN_PACKAGES))
+        events.append(
+            fake_checkout_event(
+                f"evt_bench_{i}",
+                rng.choice(user_ids),
+                package,
+                TOKEN_PACKAGES[package]["tokens"],
+            )
+        )
+    expected = dict(start_balances)
+    for event in events:
+        metadata = event["data"]["object"]["metadata"]
+        expected.setdefault(metadata["user_id"], FREE_TOKENS)
+        expected[metadata["user_id"]] += metadata["tokens"]
+
+    deliveries = [json.dumps(e).encode() for e in events] * args.duplicates
+    rng.shuffle(deliveries)
+
+    session = requests.Session()
+
+    def deliver(payload: bytes) -> tuple[int, float]:
+        headers = {
+            "Content-Type": "application/json",
+            "Stripe-Signature": sign_payload(payload, SECRET),
+        }
+        start = time.perf_counter()
+        response = session.post(url, data=payload, headers=headers)
+        return response.status_code, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(deliver, deliveries))
+    acked = time.perf_counter() - start
+
+    # crediting happens after the responses, wait for it
+    pending = None
+    while time.perf_counter() - start < acked + 30:
+        with app.app_context():
+            pending = StripeEvent.query.filter_by(status="pending").count()
+        if not pending:
+            break
+        time.sleep(0.05)
+    credited = time.perf_counter() - start
+
+    checks: dict[str, bool] = {}
+    latencies = [elapsed for _, elapsed in results]
+    checks["all_acknowledged"] = {status for status, _ in results} == {200}
+    checks["nothing_pending"] = pending == 0
+    with app.app_context():
+        checks["one_row_per_event"] = StripeEvent.query.count() == len(events)
+    checks["credited_once"] = balances() == expected
+
+    # a forged or stale signature is refused
+    payload = json.dumps(fake_checkout_event("evt_forged", user_ids[0], "large", 1))
+    forged = session.post(
+        url,
+        data=payload,
+        headers={"Stripe-Signature": sign_payload(payload.encode(), "whsec_wrong")},
+    )
+    stale = session.post(
+        url,
+        data=payload,
+        headers={
+            "Stripe-Signature": sign_payload(
+                payload.encode(), SECRET, int(time.time()) - 3600
+            )
+        },
+    )
+    checks["bad_signatures_refused"] = forged.status_code == stale.status_code == 400
+
+    # replaying everything again, directly and through the webhook, is a no-op
+    path = os.path.join(tempfile.mkdtemp(prefix="reflektion-bench-"), "events.jsonl")
+    with open(path, "w") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+    runner = app.test_cli_runner()
+    direct = runner.invoke(args=["billing", "replay", path])
+    signed = runner.invoke(args=["billing", "replay", path, "--url", url])
+    checks["replay_ok"] = direct.exit_code == signed.exit_code == 0
+    time.sleep(0.2)
+    checks["replay_credits_nothing"] = balances() == expected
+
+    # a backfill of events the webhook never received credits them
+    backfill = fake_checkout_event("evt_backfill", user_ids[0], "small", 1000)
+    with open(path, "w") as f:
+        f.write(json.dumps(backfill) + "\n")
+    runner.invoke(args=["billing", "replay", path])
+    runner.invoke(args=["billing", "replay", path])
+    checks["backfill_credited_once"] = (
+        balances()[user_ids[0]] == expected[user_ids[0]] + 1000
+    )
+
+    # the apply after this one's response failed two minutes ago, the next
+    # delivery, even a duplicate, credits it
+    with app.app_context():
+        db.session.add(
+            StripeEvent(
+                event_id="evt_stuck",
+                type="checkout.session.completed",
+                user_id=user_ids[1],
+                tokens=777,
+                attempts=1,
+                received_at=datetime.now(timezone.utc) - timedelta(minutes=2),
+            )  # type: ignore
+        )
+        db.session.commit()
+    deliver(deliveries[0])
+    time.sleep(0.2)
+    checks["stuck_event_swept"] = balances()[user_ids[1]] == expected[user_ids[1]] + 777
+    server.shutdown()
+
+    print(
+        json.dumps(
+            {
+                "deliveries": len(deliveries),
+                "events": len(events),
+                "ack_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "ack_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "ack_max_ms": round(max(latencies) * 1000, 2),
+                "all_acked_s": round(acked, 3),
+                "all_credited_s": round(credited, 3),
+                "checks": checks,
+            },
+            indent=2,
+        )
+    )
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
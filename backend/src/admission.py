@@ -0,0 +1,147 @@
+# backend/src/admission.py
+
+from flask import current_app, has_app_context, jsonify, Response
+from src.config import LLM_PRIORITIES, LLM_QUEUE_LIMIT
+from src.extensions import get_extension
+from src.locks import (
+    HOST_LOCKS,
+    POLL_SECONDS,
+    acquire_file_lock,
+    release_file_lock,
+    shared_directory,
+)
+from src.metrics import LLM_ADMISSIONS, LLM_QUEUE_DEPTH, LLM_QUEUE_SECONDS
+from contextlib import contextmanager
+from typing import Iterator
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+
+"""
+Every LLM call holds one of LLM_SLOTS slots. A slot is an flock on a file in
+LLM_SLOTS_DIR, so all workers on a host share them and a crashed worker's
+slots are freed by the kernel. Calls wait in a per-worker queue ordered by
+priority rank, up to their max_wait. When the queue is full or the wait runs
+out they raise Overloaded, which becomes a 503 with Retry-After.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"no LLM capacity, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Governor:
+    def __init__(self, slots: int, directory: str, queue_limit: int) -> None:
+        self.slots = slots
+        self.directory = directory
+        self.queue_limit = queue_limit
+
+        self._cond = threading.Condition()
+        self._waiting: list[tuple[int, int]] = []  # heap of (rank, ticket)
+        self._tickets = itertools.count()
+        self._held: set[int] = set()  # slots held by this worker
+        self._call_seconds = 1.0  # moving average, for Retry-After
+
+    def slot_limit(self, priority: str) -> int:
+        share = LLM_PRIORITIES[priority]["slots"]
+        return max(1, math.floor(self.slots * share))
+
+    def retry_after(self) -> int:
+        waiting = len(self._waiting) + 1
+        return min(60, max(1, math.ceil(self._call_seconds * waiting / self.slots)))
+
+    # one of the first `limit` slots, or None when they're all taken. Searched
+    # from the top, so higher priorities take the slots lower ones can't use
+    # before any of the shared ones
+    def _try_acquire(self, limit: int) -> tuple[int, int | None] | None:
+        for slot in reversed(range(limit)):
+            if slot in self._held:
+                continue
+            fd = None
+            if HOST_LOCKS:  # on windows slots are only shared between threads
+                path = os.path.join(self.directory, f"slot-{slot}.lock")
+                fd = acquire_file_lock(path)
+                if fd is None:
+                    continue
+            self._held.add(slot)
+            return slot, fd
+        return None
+
+    @contextmanager
+    def slot(self, priority: str) -> Iterator[None]:
+        policy = LLM_PRIORITIES[priority]
+        limit = self.slot_limit(priority)
+        start = time.monotonic()
+        deadline = start + policy["max_wait"]
+
+        with self._cond:
+            if len(self._waiting) >= self.queue_limit:
+                LLM_ADMISSIONS.inc(priority=priority, result="rejected")
+                raise Overloaded(self.retry_after())
+
+            ticket = (policy["rank"], next(self._tickets))
+            heapq.heappush(self._waiting, ticket)
+            LLM_QUEUE_DEPTH.inc(priority=priority)
+            try:
+                while True:
+                    # only the head tries, lower ranks never overtake it
+                    acquired = self._waiting[0] == ticket and self._try_acquire(limit)
+                    if acquired:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        LLM_ADMISSIONS.inc(priority=priority, result="timeout")
+                        raise Overloaded(self.retry_after())
+                    self._cond.wait(min(remaining, POLL_SECONDS))
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                LLM_QUEUE_DEPTH.dec(priority=priority)
+                self._cond.notify_all()
+
+        LLM_QUEUE_SECONDS.observe(time.monotonic() - start, priority=priority)
+        LLM_ADMISSIONS.inc(priority=priority, result="admitted")
+
+        slot, fd = acquired
+        call_start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                if fd is not None:
+                    release_file_lock(fd)
+                self._held.discard(slot)
+                elapsed = time.monotonic() - call_start
+                self._call_seconds = 0.8 * self._call_seconds + 0.2 * elapsed
+                self._cond.notify_all()
+
+
+def _build_governor() -> Governor:
+    directory = shared_directory(
+        current_app.config["LLM_SLOTS_DIR"], "reflektion-llm-slots"
+    )
+    return Governor(current_app.config["LLM_SLOTS"], directory, LLM_QUEUE_LIMIT)
+
+
+@contextmanager
+def llm_slot(priority: str) -> Iterator[None]:
+    if not has_app_context() or not current_app.config["LLM_SLOTS"]:
+        yield
+        return
+    with get_extension("llm_governor", _build_governor).slot(priority):
+        yield
+
+
+def overloaded_response(e: Overloaded) -> tuple[Response, int]:
+    logger.warning("llm_overloaded", extra={"retry_after": e.retry_after})
+    response = jsonify({"error": "Too busy right now, please try again shortly"})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 503
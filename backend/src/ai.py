@@ -1,11 +1,39 @@
 # backend/src/ai.py
 
-from anthropic import Anthropic
-from anthropic.types import MessageParam
-from src.config import ANTHROPIC_API_KEY
-from typing import Sequence
+from flask import current_app
+from src.admission import llm_slot
+from src.config import MODELS, MAX_TOKENS, CHAT_PROMPT_HEADER
+from src.extensions import get_extension
+from src.metrics import (
+    LLM_ERRORS,
+    LLM_SECONDS,
+    LLM_TOKENS,
+    LLM_TTFT_SECONDS,
+    record_stage,
+)
+from typing import TYPE_CHECKING, Sequence
+import logging
+import time
 
-client = Anthropic(api_key=ANTHROPIC_API_KEY)
+# the sdk is slow to import, only needed once a request makes a call
+if TYPE_CHECKING:
+    from anthropic import Anthropic
+    from anthropic.types import MessageParam
+
+logger = logging.getLogger(__name__)
+
+
+def _build_client() -> "Anthropic":
+    from anthropic import Anthropic
+
+    return Anthropic(
+        api_key=current_app.config["ANTHROPIC_API_KEY"],
+        base_url=current_app.config["ANTHROPIC_BASE_URL"],
+    )
+
+
+def get_client() -> "Anthropic":
+    return get_extension("anthropic", _build_client)
 
 
 class AI:
@@ -14,32 +42,89 @@ class AI:
         model: str = "claude-sonnet-4-20250514",
         max_tokens: int = 1024,
         system_prompt: str | None = None,
+        priority: str = "chat",
     ) -> None:
-        self.client: Anthropic = client
         self.model: str = model
         self.max_tokens: int = max_tokens
         self.system_prompt: str | None = system_prompt
+        self.priority: str = priority  # key of LLM_PRIORITIES
 
-    def ask(self, messages: Sequence[MessageParam]) -> tuple[str, int]:
+    @property
+    def client(self) -> "Anthropic":
+        return get_client()
+
+    def ask(
+        self,
+        messages: Sequence["MessageParam"],
+        model: str | None = None,
+        context: str | None = None,
+        priority: str | None = None,
+    ) -> tuple[str, int]:
+        model = model or self.model
         kwargs = {  # type: ignore
-            "model": self.model,
+            "model": model,
             "max_tokens": self.max_tokens,
             "messages": messages,
         }
 
-        if self.system_prompt:
-            kwargs["system"] = self.system_prompt  # type: ignore
+        # context goes after the system prompt, for this call only
+        system = "\n\n".join(p for p in (self.system_prompt, context) if p)
+        if system:
+            kwargs["system"] = system  # type: ignore
+
+        # raises Overloaded instead of waiting for a slot forever
+        with llm_slot(priority or self.priority):
+            # streamed so we can see time to first token
+            start = time.perf_counter()
+            first_token: float | None = None
+            try:
+                with self.client.messages.stream(**kwargs) as stream:  # type: ignore
+                    for _ in stream.text_stream:
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                    response = stream.get_final_message()
+            except Exception as e:
+                LLM_ERRORS.inc(model=model)
+                logger.warning("llm_failed", extra={"model": model, "error": str(e)})
+                return "", 0
+            finally:
+                elapsed = time.perf_counter() - start
+                LLM_SECONDS.observe(elapsed, model=model)
+                record_stage("llm", elapsed)
 
-        try:
-            response = self.client.messages.create(**kwargs)  # type: ignore
-        except Exception:
-            return "", 0
+        if first_token is not None:
+            LLM_TTFT_SECONDS.observe(first_token, model=model)
 
         total_tokens = 0
         if hasattr(response, "usage"):  # type: ignore
-            total_tokens = response.usage.input_tokens + response.usage.output_tokens  # type: ignore
+            input_tokens = response.usage.input_tokens  # type: ignore
+            output_tokens = response.usage.output_tokens  # type: ignore
+            LLM_TOKENS.inc(input_tokens, model=model, direction="input")
+            LLM_TOKENS.inc(output_tokens, model=model, direction="output")
+            total_tokens = input_tokens + output_tokens
+
+        logger.info(
+            "llm_call",
+            extra={
+                "model": model,
+                "duration_ms": round(elapsed * 1000, 1),
+                "ttft_ms": round(first_token * 1000, 1) if first_token else None,
+                "tokens": total_tokens,
+            },
+        )
 
         first_block = response.content[0]  # type: ignore
         if first_block.type == "text":  # type: ignore
             return first_block.text, total_tokens  # type: ignore
         return str(first_block), total_tokens  # type: ignore
+
+
+# ai instances
+chat_ai = AI(
+    model=MODELS["sonnet"],
+    max_tokens=MAX_TOKENS["chat"],
+    system_prompt=CHAT_PROMPT_HEADER,
+)
+analysis_ai = AI(
+    model=MODELS["haiku"], max_tokens=MAX_TOKENS["analysis"], priority="analysis"
+)
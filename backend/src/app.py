@@ -1,342 +1,157 @@
 # backend/src/app.py
 
-from dotenv import load_dotenv
-
-load_dotenv()
-
-from flask import Flask, request, jsonify, Response
+from flask import Flask, current_app, request, Response, g
 from flask_cors import CORS
-from src.models import db, Analysis
-from src.ai import AI
+from src.models import db, upgrade_schema
 from src.config import (
-    MODELS,
-    MAX_TOKENS,
     DATABASE_URI,
-    RATE_LIMITS,
+    REPLICA_DATABASE_URI,
     ALLOWED_ORIGINS,
-    CHAT_PROMPT_HEADER,
-    TOKEN_PACKAGES,
+    ANTHROPIC_API_KEY,
+    ANTHROPIC_BASE_URL,
+    CLERK_DOMAIN,
+    ENCRYPTION_KEY,
+    ENCRYPTION_OLD_KEYS,
     STRIPE_SECRET_KEY,
     STRIPE_WEBHOOK_SECRET,
-    MAX_CONTEXT,
+    RATELIMIT_ENABLED,
+    LLM_SLOTS,
+    LLM_SLOTS_DIR,
+    LOCKS_DIR,
+    METRICS_DIR,
+    METRICS_TOKEN,
 )
-from src.auth import get_user_id
+from src.admission import Overloaded, overloaded_response
+from src.logging_config import init_logging
+from src.metrics import REQUEST_SECONDS, init_metrics, server_timing_header
+from src.responses import CodecJSONProvider, compress_response
 from src.rate_limit import limiter
-from src.services import (
-    load_user_chat_history,
-    save_context_to_db,
-    analyse_user_conversation,
-    update_user_summary,
-    get_or_create_user,
-)
-from src.usage import (
-    check_token_limit,
-    use_tokens,
-    get_user_usage,
-    add_purchased_tokens,
-)
-from typing import cast
-import stripe
-from datetime import datetime, timezone
+from src.routes import register_blueprints
+from src.batch import batch_cli
+from src.billing import billing_cli
+from src.maintenance import maintenance_cli
+from typing import Any
+import time
 
 """
-Endpoints:
-- GET /health
-- POST /api/chat
-- GET /api/messages
-- DELETE /api/data
-- GET /api/analysis
-- POST /api/analyse
-- DELETE /api/user
-- GET /api/usage
-- GET /api/summary
-- POST /api/create-checkout
-- POST /api/stripe-webhook
+Usage:
+- gunicorn "src.app:create_app()"
+- gunicorn src.app:app (built on first access)
+- flask --app src.app <command>
 """
 
-app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
-CORS(
-    app,
-    resources={
-        r"/api/*": {
-            "origins": list(ALLOWED_ORIGINS.values()),
-            "methods": ["GET", "POST", "DELETE"],
-            "allow_headers": ["Content-Type", "Authorization"],
-        }
-    },
-)
-
-db.init_app(app)
-limiter.init_app(app)
-
-stripe.api_key = STRIPE_SECRET_KEY
-
-# ai instances
-chat_ai = AI(
-    model=MODELS["sonnet"],
-    max_tokens=MAX_TOKENS["chat"],
-    system_prompt=CHAT_PROMPT_HEADER,
-)
-analysis_ai = AI(model=MODELS["haiku"], max_tokens=MAX_TOKENS["analysis"])
-
-
-# prevent caching in cloud
-def no_cache(response: Response) -> Response:
-    response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
-    return response
-
-
-@app.route("/health", methods=["GET"])
-def health():
-    return jsonify({"status": "OK"})
-
-
-@app.route("/api/chat", methods=["POST"])
-@limiter.limit(RATE_LIMITS["chat"])
-def post_chat():
-    # authentication
-    user_id = get_user_id()
-    if not user_id:
-        return jsonify({"error": "Unauthorized"}), 401
-
-    # check tokens
-    if not check_token_limit(user_id):
-        return jsonify({"error": "Token limit reached"}), 429
-
-    data = request.get_json()
-    if not data or "message" not in data:
-        return jsonify({"error": "No data provided"}), 400
-
-    message_content = data["message"].strip()
-    if not message_content:
-        return jsonify({"error": "No message provided"}), 400
-
-    chat_history = load_user_chat_history(user_id)
-    chat_history.append(
-        {
-            "role": "user",
-            "content": message_content,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-        }
+DEFAULT_CONFIG: dict[str, Any] = {
+    "SQLALCHEMY_DATABASE_URI": DATABASE_URI,
+    "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+    "REPLICA_DATABASE_URI": REPLICA_DATABASE_URI,  # None reads from the primary
+    "RATELIMIT_ENABLED": RATELIMIT_ENABLED,
+    "ENCRYPTION_KEY": ENCRYPTION_KEY,
+    "ENCRYPTION_OLD_KEYS": ENCRYPTION_OLD_KEYS,
+    "ANTHROPIC_API_KEY": ANTHROPIC_API_KEY,
+    "ANTHROPIC_BASE_URL": ANTHROPIC_BASE_URL,  # None uses the public api
+    "CLERK_DOMAIN": CLERK_DOMAIN,
+    "STRIPE_SECRET_KEY": STRIPE_SECRET_KEY,
+    "STRIPE_WEBHOOK_SECRET": STRIPE_WEBHOOK_SECRET,
+    "LLM_SLOTS": LLM_SLOTS,
+    "LLM_SLOTS_DIR": LLM_SLOTS_DIR,
+    "LOCKS_DIR": LOCKS_DIR,
+    "METRICS_DIR": METRICS_DIR,
+    "METRICS_TOKEN": METRICS_TOKEN,
+    "SERVER_TIMING": False,  # per stage timings for every client, on in debug
+    "COMPRESS_RESPONSES": True,  # off when a proxy in front compresses
+    "CREATE_TABLES": True,
+}
+
+
+def create_app(config: dict[str, Any] | None = None) -> Flask:
+    app = Flask(__name__)
+    app.json = CodecJSONProvider(app)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(config or {})
+
+    # fail at startup rather than on the first encrypted read
+    if not app.config["ENCRYPTION_KEY"]:
+        raise RuntimeError("ENCRYPTION_KEY is not set in environment variables")
+
+    CORS(
+        app,
+        resources={
+            r"/api/*": {
+                "origins": list(ALLOWED_ORIGINS.values()),
+                "methods": ["GET", "POST", "DELETE"],
+                "allow_headers": ["Content-Type", "Authorization"],
+            }
+        },
     )
 
-    response_text, tokens = chat_ai.ask(chat_history)  # type: ignore
-    if not response_text:
-        response_text = "Sorry, I couldn't generate a response right now."
-
-    chat_history.append(
-        {
-            "role": "assistant",
-            "content": response_text,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+    if app.config["REPLICA_DATABASE_URI"]:
+        app.config.setdefault("SQLALCHEMY_BINDS", {})
+        app.config["SQLALCHEMY_BINDS"]["replica"] = {
+            "url": app.config["REPLICA_DATABASE_URI"],
+            "pool_pre_ping": True,
         }
-    )
-
-    use_tokens(user_id, tokens)
-
-    save_context_to_db(user_id, chat_history)
-
-    # rolling summary, ensures we don't lose information
-    if len(chat_history) > 0 and len(chat_history) % MAX_CONTEXT == 0:
-        print(f"✨ Auto-summarizing at {len(chat_history)} messages")
-        _, tokens = update_user_summary(user_id, analysis_ai)
-        use_tokens(user_id, tokens)
 
-    return jsonify({"response": response_text})
+    db.init_app(app)
+    limiter.init_app(app)
+    init_logging(app)
+    init_metrics(app)
 
+    register_blueprints(app)
+    app.cli.add_command(batch_cli)
+    app.cli.add_command(billing_cli)
+    app.cli.add_command(maintenance_cli)
 
-@app.route("/api/messages", methods=["GET"])
-@limiter.limit(RATE_LIMITS["read"])
-def get_messages():
-    # authentication
-    user_id = get_user_id()
-    if not user_id:
-        return jsonify({"error": "Unauthorized"}), 401
+    app.register_error_handler(Overloaded, overloaded_response)
+    app.before_request(start_timer)
+    app.after_request(record_timing)
+    # registered last so it runs first, its time shows up in Server-Timing
+    if app.config["COMPRESS_RESPONSES"]:
+        app.after_request(compress_response)
 
-    chat_history = load_user_chat_history(user_id)
-    return no_cache(jsonify({"messages": chat_history}))
+    if app.config["CREATE_TABLES"]:
+        with app.app_context():
+            db.create_all()
+            upgrade_schema()
 
+            # no connections survive into forked workers (gunicorn --preload)
+            for engine in db.engines.values():
+                engine.dispose()
 
-@app.route("/api/data", methods=["DELETE"])
-@limiter.limit(RATE_LIMITS["delete"])
-def delete_data():
-    # authentication
-    user_id = get_user_id()
-    if not user_id:
-        return jsonify({"error": "Unauthorized"}), 401
+    return app
 
-    # clear from database
-    user = get_or_create_user(user_id)
-    if user.context:
-        db.session.delete(user.context)
-    if user.summary:
-        db.session.delete(user.summary)
 
-    Analysis.query.filter_by(user_id=user_id).delete()
-    db.session.commit()
+def start_timer() -> None:
+    g.request_start = time.perf_counter()
 
-    return jsonify({"message": "Data cleared"})
-
-
-@app.route("/api/analysis", methods=["GET"])
-@limiter.limit(RATE_LIMITS["read"])
-def get_analysis():
-    # authentication
-    user_id = get_user_id()
-    if not user_id:
-        return jsonify({"error": "Unauthorized"}), 401
-
-    analyses = cast(
-        list[Analysis],
-        Analysis.query.filter_by(user_id=user_id)
-        .order_by(Analysis.timestamp.desc())
-        .limit(30)
-        .all(),
-    )
 
-    return no_cache(jsonify({"analysis": [a.to_dict() for a in analyses]}))
-
-
-@app.route("/api/analyse", methods=["POST"])
-@limiter.limit(RATE_LIMITS["analysis"])
-def post_analyse():
-    # authentication
-    user_id = get_user_id()
-    if not user_id:
-        return jsonify({"error": "Unauthorized"}), 401
-
-    if not check_token_limit(user_id):
-        return jsonify({"error": "Token limit reached"}), 429
-
-    analysis, analysis_tokens = analyse_user_conversation(user_id, analysis_ai)
-
-    if not analysis:
-        return jsonify({"error": "Not enough conversation data"}), 400
-
-    summary, summary_tokens = update_user_summary(user_id, analysis_ai)
-
-    total_tokens = analysis_tokens + summary_tokens
-    use_tokens(user_id, total_tokens)
-
-    return jsonify({"analysis": analysis.to_dict(), "summary": summary})
-
-
-@app.route("/api/user", methods=["DELETE"])
-@limiter.limit(RATE_LIMITS["delete"])
-def delete_user():
-    # authentication
-    user_id = get_user_id()
-    if not user_id:
-        return jsonify({"error": "Unauthorized"}), 401
-
-    # delete user (cascades to all data)
-    user = get_or_create_user(user_id)
-    db.session.delete(user)
-    db.session.commit()
-
-    return jsonify({"message": "User deleted"})
-
-
-@app.route("/api/usage", methods=["GET"])
-@limiter.limit(RATE_LIMITS["read"])
-def get_usage():
-    # authentication
-    user_id = get_user_id()
-    if not user_id:
-        return jsonify({"error": "Unauthorized"}), 401
-
-    usage = get_user_usage(user_id)
-    return no_cache(jsonify(usage))
-
-
-@app.route("/api/summary", methods=["GET"])
-@limiter.limit(RATE_LIMITS["read"])
-def get_summary():
-    # authentication
-    user_id = get_user_id()
-    if not user_id:
-        return jsonify({"error": "Unauthorized"}), 401
-
-    user = get_or_create_user(user_id)
-    if not user.summary:
-        return no_cache(jsonify({"summary": None}))
-
-    return jsonify({"summary": user.summary.summary})
-
-
-@app.route("/api/create-checkout", methods=["POST"])
-@limiter.limit(RATE_LIMITS["read"])
-def create_checkout():
-    # authentication
-    user_id = get_user_id()
-    if not user_id:
-        return jsonify({"error": "Unauthorized"}), 401
-
-    data = request.get_json()
-    package = data.get("packageType")
-
-    if package not in TOKEN_PACKAGES:
-        return jsonify({"error": "Invalid package"}), 400
-
-    try:
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[
-                {
-                    "price": TOKEN_PACKAGES[package]["price_id"],
-                    "quantity": 1,
-                }
-            ],
-            mode="payment",
-            success_url=f"{ALLOWED_ORIGINS["production"]}/?success=true",
-            cancel_url=f"{ALLOWED_ORIGINS["production"]}/?canceled=true",
-            client_reference_id=user_id,
-            metadata={
-                "user_id": user_id,
-                "package": package,
-                "tokens": TOKEN_PACKAGES[package]["tokens"],
-            },
+def record_timing(response: Response) -> Response:
+    start = g.get("request_start")
+    if start is not None:
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            endpoint=request.endpoint or "unknown",
+            method=request.method,
+            status=str(response.status_code),
         )
 
-        return jsonify({"url": checkout_session.url})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    # per stage breakdown, shows up in the browser dev tools
+    if current_app.config["SERVER_TIMING"] or current_app.debug:
+        header = server_timing_header()
+        if header:
+            response.headers["Server-Timing"] = header
 
+    return response
 
-@app.route("/api/stripe-webhook", methods=["POST"])
-def stripe_webhook():
-    payload = request.data
-    sig_header = request.headers.get("Stripe-Signature")
-
-    try:
-        event = stripe.Webhook.construct_event(  # type: ignore
-            payload, sig_header, STRIPE_WEBHOOK_SECRET
-        )
-    except Exception as e:
-        return jsonify({"error": str(e)}), 400
-
-    # handle successful payment
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        user_id = session["metadata"]["user_id"]
-        tokens = int(session["metadata"]["tokens"])
-
-        # add purchased tokens
-        add_purchased_tokens(user_id, tokens)
-
-        print(f"✨ Added {tokens} tokens to user {user_id}")
-
-    return jsonify({"status": "success"})
 
+def __getattr__(name: str) -> Any:
+    # keeps `src.app:app` working without building an app on import
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-with app.app_context():
-    db.create_all()
 
 # for local dev I guess
 if __name__ == "__main__":
-    app.run(debug=True, port=8000)
+    create_app().run(debug=True, port=8000)
@@ -1,11 +1,27 @@
-from flask import request
+from flask import current_app, g, request
 import jwt
-from src.config import CLERK_DOMAIN
+from src.extensions import get_extension
+from src.metrics import timed
 
-JWKS_URL = f"{CLERK_DOMAIN}/.well-known/jwks.json"
+
+def get_jwks_client() -> jwt.PyJWKClient:
+    # caches the key set, so verifying doesn't fetch it on every request
+    return get_extension(
+        "jwks",
+        lambda: jwt.PyJWKClient(
+            f"{current_app.config['CLERK_DOMAIN']}/.well-known/jwks.json"
+        ),
+    )
 
 
 def get_user_id() -> str | None:
+    # the rate limiter and the endpoint both ask
+    if "user_id" not in g:
+        g.user_id = _verify_user_id()
+    return g.user_id
+
+
+def _verify_user_id() -> str | None:
     auth_header = request.headers.get("Authorization", "")
     if not auth_header.startswith("Bearer "):
         return None
@@ -13,13 +29,16 @@ def get_user_id() -> str | None:
     token = auth_header.replace("Bearer ", "")
 
     try:
-        jwks_client = jwt.PyJWKClient(JWKS_URL)
-        signing_key = jwks_client.get_signing_key_from_jwt(token)
-
-        # verify and decode the token
-        decoded = jwt.decode(
-            token, signing_key.key, algorithms=["RS256"], options={"verify_aud": False}
-        )
+        with timed("jwt_verify"):
+            signing_key = get_jwks_client().get_signing_key_from_jwt(token)
+
+            # verify and decode the token
+            decoded = jwt.decode(
+                token,
+                signing_key.key,
+                algorithms=["RS256"],
+                options={"verify_aud": False},
+            )
 
         user_id = decoded.get("sub")
         return user_id
@@ -0,0 +1,236 @@
+# backend/src/batch.py
+
+from src.models import db, Analysis, AnalysisBatch, AnalysisBatchItem, Context, User
+from src.ai import AI
+from src.config import MODELS, MAX_TOKENS, MIN_ANALYSIS_CONTEXT
+from src.services import (
+    ANALYSIS_PROMPTS,
+    build_analysis_prompts,
+    _clean_json_response,
+)
+from src.usage import use_tokens
+from flask.cli import AppGroup
+from datetime import datetime, timezone
+from sqlalchemy import func
+from typing import Any, cast
+import click
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+batch_cli = AppGroup("batch", help="Bulk analysis through the Message Batches API.")
+
+batch_ai = AI(model=MODELS["haiku"], max_tokens=MAX_TOKENS["analysis"])
+
+
+# compared in sql on the stored message counts, only histories saved before
+# there was a count are decrypted, and counted once so they aren't again
+def select_users_for_batch(min_new_messages: int, limit: int) -> list[str]:
+    analysed = (
+        db.session.query(
+            Analysis.user_id, func.max(Analysis.watermark).label("watermark")
+        )
+        .group_by(Analysis.user_id)
+        .subquery()
+    )
+    watermark = func.coalesce(analysed.c.watermark, 0)
+    pending = db.session.query(AnalysisBatchItem.user_id).filter_by(status="pending")
+
+    query = (
+        db.session.query(Context.id, Context.user_id, Context.message_count, watermark)
+        .join(User, User.user_id == Context.user_id)
+        .outerjoin(analysed, analysed.c.user_id == Context.user_id)
+        .filter(
+            User.tokens_available > 0,
+            Context.user_id.not_in(pending),
+            Context.message_count.is_(None)
+            | (Context.message_count - watermark >= min_new_messages),
+        )
+        .order_by(Context.id)
+    )
+
+    selected = []
+    counted = False
+    for context_id, user_id, message_count, analysed_to in query.all():
+        if message_count is None:
+            context = cast(Context, db.session.get(Context, context_id))
+            context.message_count = len(context.messages)  # type: ignore
+            counted = True
+            if context.message_count - analysed_to < min_new_messages:
+                continue
+
+        selected.append(cast(str, user_id))
+        if len(selected) >= limit:
+            break
+
+    if counted:
+        db.session.commit()
+    return selected
+
+
+def submit_analysis_batch(
+    min_new_messages: int = MIN_ANALYSIS_CONTEXT, limit: int = 1000
+) -> AnalysisBatch | None:
+    user_ids = select_users_for_batch(min_new_messages, limit)
+    if not user_ids:
+        return None
+
+    batch = AnalysisBatch()
+    db.session.add(batch)
+
+    prompts_by_item: list[tuple[AnalysisBatchItem, dict[str, str]]] = []
+    for user_id in user_ids:
+        prompts, watermark, _ = build_analysis_prompts(user_id)
+        if not prompts:
+            continue  # too little history, or nothing new
+        item = AnalysisBatchItem(batch=batch, user_id=user_id, watermark=watermark)  # type: ignore
+        db.session.add(item)
+        prompts_by_item.append((item, prompts))
+
+    # item ids go into the custom ids, so user ids never leave the database
+    db.session.flush()
+
+    requests: list[dict[str, Any]] = []
+    for item, prompts in prompts_by_item:
+        for attribute, prompt in prompts.items():
+            requests.append(
+                {
+                    "custom_id": f"{item.id}-{attribute}",
+                    "params": {
+                        "model": batch_ai.model,
+                        "max_tokens": batch_ai.max_tokens,
+                        "messages": [{"role": "user", "content": prompt}],
+                    },
+                }
+            )
+
+    try:
+        created = batch_ai.client.messages.batches.create(requests=requests)  # type: ignore
+    except Exception:
+        db.session.rollback()
+        raise
+
+    batch.batch_id = created.id  # type: ignore
+    db.session.commit()
+
+    logger.info(
+        "batch_submitted",
+        extra={
+            "batch_id": created.id,
+            "users": len(prompts_by_item),
+            "requests": len(requests),
+        },
+    )
+    return batch
+
+
+# "applied", "failed" or "skipped"
+def _apply_item(item: AnalysisBatchItem, results: dict[str, tuple[Any, int]]) -> str:
+    # the user cleared their history since, or a newer analysis covers it,
+    # neither is written back nor charged
+    count = (
+        db.session.query(Context.message_count).filter_by(user_id=item.user_id).first()
+    )
+    latest = (
+        db.session.query(func.max(Analysis.watermark))
+        .filter_by(user_id=item.user_id)
+        .scalar()
+    )
+    if (
+        count is None
+        or (count[0] is not None and count[0] < item.watermark)
+        or (latest is not None and latest >= item.watermark)
+    ):
+        item.status = "skipped"  # type: ignore
+        return "skipped"
+
+    tokens = sum(t for _, t in results.values())
+    data = {attribute: value for attribute, (value, _) in results.items()}
+
+    # all three parts or nothing, tokens are charged either way
+    if len(data) == len(ANALYSIS_PROMPTS) and all(v is not None for v in data.values()):
+        analysis = Analysis(
+            user_id=item.user_id, watermark=item.watermark, **data
+        )  # type: ignore
+        db.session.add(analysis)
+        item.status = "applied"  # type: ignore
+    else:
+        item.status = "failed"  # type: ignore
+
+    # use_tokens commits, together with the item status and analysis
+    use_tokens(cast(str, item.user_id), tokens)
+    return cast(str, item.status)
+
+
+def poll_analysis_batches() -> dict[str, int]:
+    counts = {"in_progress": 0, "applied": 0, "failed": 0, "skipped": 0}
+    batches = cast(
+        list[AnalysisBatch],
+        AnalysisBatch.query.filter_by(status="in_progress")
+        .filter(AnalysisBatch.batch_id.isnot(None))
+        .all(),
+    )
+
+    for batch in batches:
+        remote = batch_ai.client.messages.batches.retrieve(batch.batch_id)  # type: ignore
+        if remote.processing_status != "ended":
+            counts["in_progress"] += 1
+            continue
+
+        # item id -> attribute -> (parsed json or None, tokens)
+        results: dict[int, dict[str, tuple[Any, int]]] = {}
+        for entry in batch_ai.client.messages.batches.results(batch.batch_id):  # type: ignore
+            item_id, attribute = entry.custom_id.split("-", 1)
+            value, tokens = None, 0
+            if entry.result.type == "succeeded":
+                message = entry.result.message
+                tokens = message.usage.input_tokens + message.usage.output_tokens
+                try:
+                    value = json.loads(_clean_json_response(message.content[0].text))  # type: ignore
+                except Exception:
+                    value = None
+            results.setdefault(int(item_id), {})[attribute] = (value, tokens)
+
+        for item in batch.items:
+            if item.status != "pending":
+                continue  # already applied by an earlier, interrupted poll
+            counts[_apply_item(item, results.get(item.id, {}))] += 1
+
+        batch.status = "ended"  # type: ignore
+        batch.ended_at = datetime.now(timezone.utc)  # type: ignore
+        db.session.commit()
+
+        logger.info("batch_applied", extra={"batch_id": batch.batch_id, **counts})
+
+    return counts
+
+
+@batch_cli.command("submit")
+@click.option("--min-new", default=MIN_ANALYSIS_CONTEXT, show_default=True)
+@click.option("--limit", default=1000, show_default=True, help="max users per batch")
+def submit_command(min_new: int, limit: int) -> None:
+    """Submit analyses for users with enough new messages."""
+    batch = submit_analysis_batch(min_new, limit)
+    if batch is None:
+        click.echo("No users need an analysis")
+        return
+    click.echo(f"Submitted {batch.batch_id} with {len(batch.items)} users")
+
+
+@batch_cli.command("poll")
+@click.option("--wait", is_flag=True, help="keep polling until every batch ended")
+@click.option("--interval", default=60.0, show_default=True)
+def poll_command(wait: bool, interval: float) -> None:
+    """Write back the results of finished batches."""
+    while True:
+        counts = poll_analysis_batches()
+        click.echo(
+            f"applied {counts['applied']}, failed {counts['failed']}, "
+            f"skipped {counts['skipped']}, "
+            f"{counts['in_progress']} batches still in progress"
+        )
+        if not wait or not counts["in_progress"]:
+            return
+        time.sleep(interval)
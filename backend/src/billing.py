@@ -0,0 +1,224 @@
+# backend/src/billing.py
+
+from flask import Flask, current_app
+from flask.cli import AppGroup
+from src.models import db, StripeEvent
+from src.config import (
+    STRIPE_EVENT_MAX_ATTEMPTS,
+    STRIPE_SWEEP_AFTER_SECONDS,
+    STRIPE_SWEEP_EVENTS,
+)
+from src.metrics import STRIPE_EVENTS
+from src.replica import mark_write
+from src.usage import add_purchased_tokens
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import case, update
+from sqlalchemy.exc import IntegrityError
+from typing import Any, Iterator, cast
+import click
+import hashlib
+import hmac
+import json
+import logging
+import time
+
+"""
+The webhook only verifies the signature and records the event, keyed by
+Stripe's event id, then answers. Tokens are credited after the response has
+been sent (apply_stripe_event). Each delivery also retries a few events a
+failed apply or a crashed worker left pending, and `flask billing process`,
+run every few minutes from cron, catches them when no deliveries come in.
+Stripe retries and replays hit the unique event
+id and change nothing, and an event is marked processed in the same
+transaction that credits its tokens, so it's credited exactly once.
+"""
+
+logger = logging.getLogger(__name__)
+
+billing_cli = AppGroup("billing", help="Stripe event processing and replay.")
+
+HANDLED_EVENTS = ("checkout.session.completed",)
+
+
+# None when the event is a duplicate or not one we handle
+def record_stripe_event(event: Any) -> StripeEvent | None:
+    event_type = event["type"]
+    if event_type not in HANDLED_EVENTS:
+        STRIPE_EVENTS.inc(type=event_type, result="ignored")
+        return None
+
+    record = StripeEvent(event_id=event["id"], type=event_type)  # type: ignore
+    try:
+        metadata = event["data"]["object"]["metadata"]
+        record.user_id = str(metadata["user_id"])  # type: ignore
+        record.tokens = int(metadata["tokens"])  # type: ignore
+    except (KeyError, TypeError, ValueError):
+        # kept so the event shows up when looking for lost purchases
+        record.status = "failed"  # type: ignore
+        record.error = "missing user_id or tokens metadata"  # type: ignore
+
+    db.session.add(record)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        STRIPE_EVENTS.inc(type=event_type, result="duplicate")
+        return None
+
+    STRIPE_EVENTS.inc(type=event_type, result="recorded")
+    return record if record.status == "pending" else None
+
+
+def apply_stripe_event(record_id: int) -> bool:
+    record = db.session.get(StripeEvent, record_id)
+    if record is None or record.status != "pending":
+        return False
+    event_type, user_id, tokens = record.type, record.user_id, record.tokens
+
+    try:
+        # whoever flips the status credits the tokens, in the same transaction
+        claimed = db.session.execute(
+            update(StripeEvent)
+            .where(StripeEvent.id == record_id, StripeEvent.status == "pending")
+            .values(
+                status="processed",
+                attempts=StripeEvent.attempts + 1,
+                processed_at=datetime.now(timezone.utc),
+            )
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
+            return False
+        add_purchased_tokens(cast(str, user_id), cast(int, tokens))
+        mark_write(cast(str, user_id))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        attempts = StripeEvent.attempts + 1
+        db.session.execute(
+            update(StripeEvent)
+            .where(StripeEvent.id == record_id, StripeEvent.status == "pending")
+            .values(
+                attempts=attempts,
+                error=str(e),
+                status=case(
+                    (attempts >= STRIPE_EVENT_MAX_ATTEMPTS, "failed"),
+                    else_="pending",
+                ),
+            )
+        )
+        db.session.commit()
+        STRIPE_EVENTS.inc(type=event_type, result="error")
+        logger.exception("stripe_event_failed", extra={"record_id": record_id})
+        return False
+
+    STRIPE_EVENTS.inc(type=event_type, result="processed")
+    logger.info("tokens_purchased", extra={"user_id": user_id, "tokens": tokens})
+    return True
+
+
+# runs from Response.call_on_close, after the request context is gone
+def apply_after_response(app: Flask, record_id: int | None) -> None:
+    with app.app_context():
+        if record_id is not None:
+            try:
+                apply_stripe_event(record_id)
+            except Exception:
+                # left pending for the next sweep
+                logger.exception("stripe_event_failed", extra={"record_id": record_id})
+
+        try:
+            process_stripe_events(STRIPE_SWEEP_EVENTS, STRIPE_SWEEP_AFTER_SECONDS)
+        except Exception:
+            logger.exception("stripe_sweep_failed")
+
+
+# older_than leaves alone events a worker may still be applying
+def process_stripe_events(limit: int = 1000, older_than: float = 0) -> dict[str, int]:
+    counts = {"processed": 0, "skipped": 0}
+    received_before = datetime.now(timezone.utc) - timedelta(seconds=older_than)
+    record_ids = [
+        record_id
+        for (record_id,) in db.session.query(StripeEvent.id)
+        .filter_by(status="pending")
+        .filter(StripeEvent.received_at <= received_before)
+        .order_by(StripeEvent.id)
+        .limit(limit)
+    ]
+    for record_id in record_ids:
+        applied = apply_stripe_event(record_id)
+        counts["processed" if applied else "skipped"] += 1
+    return counts
+
+
+# the Stripe-Signature header for a payload, the way Stripe computes it
+def sign_payload(payload: bytes, secret: str, timestamp: int | None = None) -> str:
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signed = f"{timestamp}.".encode() + payload
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+# a json array of events or one event per line
+def read_events(path: str) -> Iterator[dict[str, Any]]:
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        yield from json.loads(text)
+        return
+    for line in text.splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+
+@billing_cli.command("process")
+@click.option("--limit", default=1000, show_default=True)
+def process_command(limit: int) -> None:
+    """Credit events that are still pending."""
+    counts = process_stripe_events(limit)
+    click.echo(f"processed {counts['processed']}, skipped {counts['skipped']}")
+
+
+@billing_cli.command("replay")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--url", help="sign each event and post it to this webhook instead")
+def replay_command(path: str, url: str | None) -> None:
+    """Replay Stripe events from a file, for backfills and tests.
+
+    Without --url the events are recorded and credited directly, events that
+    were already recorded are skipped. With --url they're signed with
+    STRIPE_WEBHOOK_SECRET and sent through the webhook.
+    """
+    counts = {"sent": 0, "new": 0, "skipped": 0}
+    session = None
+    if url:
+        import requests
+
+        session = requests.Session()
+    secret = current_app.config["STRIPE_WEBHOOK_SECRET"]
+
+    for event in read_events(path):
+        if session is not None:
+            payload = json.dumps(event).encode()
+            response = session.post(
+                cast(str, url),
+                data=payload,
+                headers={
+                    "Content-Type": "application/json",
+                    "Stripe-Signature": sign_payload(payload, secret),
+                },
+            )
+            response.raise_for_status()
+            counts["sent"] += 1
+            continue
+
+        record = record_stripe_event(event)
+        if record is None:
+            counts["skipped"] += 1
+        else:
+            apply_stripe_event(cast(int, record.id))
+            counts["new"] += 1
+
+    click.echo(
+        f"sent {counts['sent']}, new {counts['new']}, skipped {counts['skipped']}"
+    )
@@ -0,0 +1,62 @@
+# backend/src/cache.py
+
+from flask import current_app, has_app_context
+from src.locks import (
+    HOST_LOCKS,
+    acquire_file_lock,
+    release_file_lock,
+    shared_directory,
+)
+from contextlib import contextmanager
+from typing import Iterator
+import hashlib
+import os
+import threading
+import time
+
+_lock = threading.Lock()
+_locks: dict[str, list] = {}  # key: [lock, callers holding or waiting]
+
+
+def _lock_path(key: str) -> str:
+    directory = shared_directory(
+        has_app_context() and current_app.config["LOCKS_DIR"] or None,
+        "reflektion-locks",
+    )
+    return os.path.join(directory, hashlib.sha256(key.encode()).hexdigest())
+
+
+# coalesce concurrent work on the same key, across threads and across the
+# workers on a host. Callers take turns, yields True for a caller that didn't
+# have to wait and False for callers that waited on someone else's work and
+# should look for its result first. Past the timeout they go ahead anyway
+@contextmanager
+def single_flight(key: str, timeout: float = 120) -> Iterator[bool]:
+    deadline = time.monotonic() + timeout
+    with _lock:
+        entry = _locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    lock: threading.Lock = entry[0]
+
+    held = False
+    fd = None
+    try:
+        leader = held = lock.acquire(blocking=False)
+        if not held:
+            held = lock.acquire(timeout=timeout)
+        if held and HOST_LOCKS:  # on windows only threads are coalesced
+            path = _lock_path(key)
+            fd = acquire_file_lock(path)
+            if fd is None:
+                leader = False
+                fd = acquire_file_lock(path, max(deadline - time.monotonic(), 0))
+        yield leader
+    finally:
+        if fd is not None:
+            release_file_lock(fd)
+        if held:
+            lock.release()
+        with _lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[key]
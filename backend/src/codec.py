@@ -0,0 +1,84 @@
+# backend/src/codec.py
+
+from src.config import JSON_BACKEND
+from typing import Any, Callable
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # optional, stdlib json is always available
+    orjson = None
+
+
+def _json_dumps(value: Any) -> str:
+    return json.dumps(value)
+
+
+def _orjson_dumps(value: Any) -> str:
+    return orjson.dumps(value).decode()  # type: ignore
+
+
+# responses, like flask's provider: sorted keys, compact, and `default` for
+# dates and dataclasses
+def _json_dumps_response(value: Any, default: Callable[[Any], Any]) -> bytes:
+    return json.dumps(
+        value, default=default, sort_keys=True, separators=(",", ":")
+    ).encode()
+
+
+def _orjson_dumps_response(value: Any, default: Callable[[Any], Any]) -> bytes:
+    return orjson.dumps(  # type: ignore
+        value,
+        default=default,
+        option=orjson.OPT_SORT_KEYS  # type: ignore
+        | orjson.OPT_NON_STR_KEYS  # type: ignore
+        | orjson.OPT_PASSTHROUGH_DATETIME  # type: ignore
+        | orjson.OPT_PASSTHROUGH_DATACLASS,  # type: ignore
+    )
+
+
+BACKENDS: dict[
+    str,
+    tuple[
+        Callable[[Any], str],
+        Callable[[str | bytes], Any],
+        Callable[[Any, Callable[[Any], Any]], bytes],
+    ],
+] = {
+    "json": (_json_dumps, json.loads, _json_dumps_response),
+}
+if orjson is not None:
+    BACKENDS["orjson"] = (_orjson_dumps, orjson.loads, _orjson_dumps_response)
+
+backend = "json"
+_dumps, _loads, _dumps_response = BACKENDS[backend]
+
+
+def set_backend(name: str) -> str:
+    global backend, _dumps, _loads, _dumps_response
+
+    if name not in BACKENDS:
+        logger.warning("json_backend_unavailable", extra={"backend": name})
+        name = "json"
+
+    backend = name
+    _dumps, _loads, _dumps_response = BACKENDS[name]
+    return name
+
+
+def dumps(value: Any) -> str:
+    return _dumps(value)
+
+
+def loads(data: str | bytes) -> Any:
+    return _loads(data)
+
+
+def dumps_response(value: Any, default: Callable[[Any], Any]) -> bytes:
+    return _dumps_response(value, default)
+
+
+set_backend(JSON_BACKEND)
@@ -1,8 +1,11 @@
 # backend/src/config.py
 
+from dotenv import load_dotenv
 import os
 from typing import Any
 
+load_dotenv()
+
 MODELS = {
     "sonnet": "claude-sonnet-4-5-20250929",
     "haiku": "claude-haiku-4-5-20251001",
@@ -13,8 +16,63 @@ MAX_TOKENS = {
     "analysis": 2048,
 }
 
+# per user tier, chat turns that match none of the "needs depth" rules go to
+# the light model
+CHAT_ROUTING_POLICIES: dict[str, dict[str, Any]] = {
+    "free": {
+        "light_model": "haiku",
+        "default_model": "sonnet",
+        "max_light_chars": 200,  # longer messages get the default model
+        "max_light_depth": 20,  # so do conversations with more messages
+    },
+}
+CHAT_MODEL_OVERRIDE = os.getenv("CHAT_MODEL_OVERRIDE")  # key of MODELS or model id
+
 MAX_CONTEXT = 10  # user messages
 MIN_ANALYSIS_CONTEXT = 5  # user messages
+CHAT_WINDOW = 40  # most recent messages sent with each chat turn
+
+# tiered summaries: segments of messages, periods of segments, one profile
+SUMMARY_SEGMENT_SIZE = MAX_CONTEXT  # messages per segment
+SUMMARY_PERIOD_SEGMENTS = 10  # segments per period
+SUMMARY_MAX_SEGMENTS_PER_UPDATE = 3  # spreads out backfilling older histories
+SUMMARY_CONTEXT_PERIODS = 2  # latest periods included in analysis prompts
+
+# llm admission control, every worker on a host shares LLM_SLOTS concurrent
+# calls. Lower priorities may only use some of the slots, so there is always
+# room left for chat, and waiting calls are served in rank order
+LLM_PRIORITIES: dict[str, dict[str, Any]] = {
+    "chat": {"rank": 0, "slots": 1.0, "max_wait": 10},
+    "summary": {"rank": 1, "slots": 0.75, "max_wait": 5},  # deferred, not failed
+    "analysis": {"rank": 2, "slots": 0.5, "max_wait": 30},
+}
+LLM_QUEUE_LIMIT = 32  # waiting calls per worker, beyond it requests get a 503
+LLM_SLOTS = int(os.getenv("LLM_SLOTS", "8"))  # 0 turns admission control off
+LLM_SLOTS_DIR = os.getenv("LLM_SLOTS_DIR")  # lock files, a temp dir by default
+
+# lock files that coalesce concurrent analyses and summaries of one user
+# across workers, a temp dir by default
+LOCKS_DIR = os.getenv("LOCKS_DIR")
+
+# /metrics, every worker on a host writes its series to METRICS_DIR (a temp
+# dir by default) and a scrape adds them up. Scrapers send METRICS_TOKEN as a
+# bearer token, without one the endpoint is off
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_SECONDS = 5
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# read replica, reads go to the primary for a while after a user's own writes
+# and whenever the replica is down or further behind than the max lag
+REPLICA_READ_YOUR_WRITES_SECONDS = 10
+REPLICA_MAX_LAG_SECONDS = 5
+REPLICA_CHECK_SECONDS = 5  # how often the lag is measured, per process
+
+# past exchanges retrieved into the chat context
+RETRIEVAL_DIM = 256  # hashing vectorizer features
+RETRIEVAL_BLOCK_SIZE = 1024  # message vectors per encrypted block
+RETRIEVAL_CACHE_BYTES = 64 * 1024 * 1024  # decrypted full blocks per process
+RETRIEVAL_TOP_K = 3  # exchanges per chat turn
+RETRIEVAL_MIN_SCORE = 0.2  # cosine similarity
 
 
 def add_sslmode(db_uri: str) -> str:
@@ -24,13 +82,29 @@ def add_sslmode(db_uri: str) -> str:
 
 
 DATABASE_URI: str = add_sslmode(os.getenv("DATABASE_URI", "sqlite:///reflektion.db"))
+REPLICA_DATABASE_URI = os.getenv("REPLICA_DATABASE_URI")  # read-only endpoints
+if REPLICA_DATABASE_URI and REPLICA_DATABASE_URI.startswith("postgres"):
+    REPLICA_DATABASE_URI = add_sslmode(REPLICA_DATABASE_URI)
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL")  # None uses the public api
 CLERK_DOMAIN = os.getenv("CLERK_DOMAIN")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 FLASK_ENV = os.getenv("FLASK_ENV", "development")
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
+# still accepted for decryption while `flask maintenance reencrypt` rotates them
+ENCRYPTION_OLD_KEYS = [k for k in os.getenv("ENCRYPTION_OLD_KEYS", "").split(",") if k]
 SENTRY_DSN = os.getenv("SENTRY_DSN")
+RATELIMIT_ENABLED = os.getenv("RATELIMIT_ENABLED", "true").lower() != "false"
+JSON_BACKEND = os.getenv("JSON_BACKEND", "json")  # "json" or "orjson"
+
+# responses
+COMPRESS_MIN_BYTES = 1400  # about one packet, smaller ones aren't worth it
+COMPRESS_MIMETYPES = ("application/json", "text/plain")
+GZIP_LEVEL = 5  # 6 costs over twice the cpu for about 10% smaller bodies
+BROTLI_QUALITY = 4  # the higher ones cost more cpu than they save in transfer
+STREAM_MIN_ITEMS = 1000  # arrays at least this long are streamed
+STREAM_CHUNK_ITEMS = 500
 
 BIG_FIVE_PROMPT_HEADER = """
 Analyse this conversation and determine the user's Big Five personality traits.
@@ -86,6 +160,12 @@ Return ONLY valid JSON with this exact structure:
 }
 """
 
+DELTA_ANALYSIS_PROMPT_HEADER = """
+You analysed this user before, your previous result is included below.
+Update it using only the new messages since then. Keep each value unless the
+new messages give clear evidence for a change.
+"""
+
 SUMMARY_PROMPT_HEADER = """
 You maintain a rolling summary of the user's conversations.
 Never refer to yourself.
@@ -95,10 +175,27 @@ Update the summary to include:
 - Progress or changes over time  
 - Important events mentioned
 
-You will be given the previous summary along with the recent conversations (weigh these two evenly).
+You will be given the previous summary along with summaries of the conversations since then
+and/or the most recent messages (weigh the previous summary and the new material evenly).
 Keep it concise (under 500 words). Return ONLY the updated summary.
 """
 
+SEGMENT_SUMMARY_PROMPT_HEADER = """
+Summarise this part of a conversation between a user and a reflection assistant.
+Never refer to yourself.
+
+Keep the concrete details: events, people, decisions, feelings and how they changed.
+Keep it under 150 words. Return ONLY the summary.
+"""
+
+PERIOD_SUMMARY_PROMPT_HEADER = """
+Merge these consecutive conversation summaries into one summary of the whole period.
+Never refer to yourself.
+
+Keep recurring themes, important events and any changes over the period, in order.
+Keep it under 300 words. Return ONLY the merged summary.
+"""
+
 CHAT_PROMPT_HEADER = """
 You help users reflect on their thoughts and emotions.
 
@@ -139,6 +236,11 @@ TOKEN_PACKAGES: dict[str, dict[str, Any]] = {
 }
 
 FREE_TOKENS = 30000
+STRIPE_EVENT_MAX_ATTEMPTS = 5  # then the event is marked failed
+# every webhook delivery also retries this many events left pending for longer
+# than STRIPE_SWEEP_AFTER_SECONDS, by a failed apply or a worker that died
+STRIPE_SWEEP_EVENTS = 10
+STRIPE_SWEEP_AFTER_SECONDS = 60
 
 ALLOWED_ORIGINS = {
     "development": "http://localhost:5173",
@@ -0,0 +1,17 @@
+# backend/src/extensions.py
+
+from flask import current_app
+from typing import Callable, TypeVar
+import os
+
+T = TypeVar("T")
+
+
+# clients are built on first use in each process, so nothing created before a
+# gunicorn --preload fork is shared with the workers
+def get_extension(name: str, factory: Callable[[], T]) -> T:
+    key = f"{name}:{os.getpid()}"
+    extension = current_app.extensions.get(key)
+    if extension is None:
+        extension = current_app.extensions[key] = factory()
+    return extension
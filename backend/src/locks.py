@@ -0,0 +1,50 @@
+# backend/src/locks.py
+
+from typing import Any
+import os
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # windows, callers fall back to locking within a worker
+    fcntl = None  # type: ignore
+
+"""
+Host wide locks for the LLM slots, single_flight and the metrics files. Each
+is an flock on a file that every worker on the host opens, so a crashed
+worker's locks are freed by the kernel. Waiting is polling, a release doesn't
+wake anyone up.
+"""
+
+HOST_LOCKS = fcntl is not None
+
+# how often a waiting caller tries again
+POLL_SECONDS = 0.05
+
+
+# the configured directory, or one named `name` in the temp dir
+def shared_directory(configured: str | None, name: str) -> str:
+    directory = configured or os.path.join(tempfile.gettempdir(), name)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+# an open fd holding the flock, or None when someone else still held it after
+# timeout seconds. 0 tries once, None waits as long as it takes
+def acquire_file_lock(path: str, timeout: float | None = 0) -> int | None:
+    deadline = None if timeout is None else time.monotonic() + timeout
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)  # type: ignore
+            return fd
+        except OSError:
+            if deadline is not None and time.monotonic() >= deadline:
+                os.close(fd)
+                return None
+            time.sleep(POLL_SECONDS)
+
+
+def release_file_lock(fd: Any) -> None:
+    os.close(fd)  # releases the flock
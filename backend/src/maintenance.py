@@ -0,0 +1,474 @@
+# backend/src/maintenance.py
+
+from flask.cli import AppGroup
+from src import codec
+from src.models import (
+    db,
+    build_cipher,
+    get_encryption_keys,
+    User,
+    Context,
+    Analysis,
+    AnalysisBatchItem,
+    AnalysisCache,
+    MaintenanceJob,
+    MessageIndexBlock,
+    StripeEvent,
+    Summary,
+    SummarySegment,
+)
+from src.config import FREE_TOKENS, RETRIEVAL_BLOCK_SIZE
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import bindparam, delete, func, insert, update
+from typing import Any, Callable, cast
+import click
+import logging
+import os
+import time
+
+"""
+Fleet-wide jobs over every user. Users are walked in keyset-paginated chunks
+of User.id. A chunk's rows are loaded here and the CPU-bound work (Fernet,
+json, embedding) runs in a process pool. The results are written back in one
+transaction together with the job's checkpoint, while the pool already works
+on the next chunk. An interrupted job resumes after its last committed chunk.
+
+    flask --app src.app maintenance reencrypt --workers 8
+    flask --app src.app maintenance reindex
+    flask --app src.app maintenance purge-stale --days 365 --dry-run
+"""
+
+logger = logging.getLogger(__name__)
+
+maintenance_cli = AppGroup("maintenance", help="Bulk jobs over every user.")
+
+# user rows of a chunk, (User.id, User.user_id)
+Users = list[tuple[int, str]]
+
+# every encrypted column, by model
+ENCRYPTED_COLUMNS: dict[str, tuple[Any, tuple[str, ...]]] = {
+    "context": (Context, ("messages_encrypted",)),
+    "analysis": (
+        Analysis,
+        (
+            "big_five_personality_encrypted",
+            "thinking_patterns_encrypted",
+            "communication_style_encrypted",
+        ),
+    ),
+    "summary": (Summary, ("summary_encrypted",)),
+    "summary_segment": (SummarySegment, ("summary_encrypted",)),
+    "message_index_block": (MessageIndexBlock, ("vectors_encrypted",)),
+}
+
+# set in every pool worker, they have no app context
+_worker_keys: list[str] = []
+
+
+def _init_worker(keys: list[str]) -> None:
+    global _worker_keys
+    _worker_keys = keys
+
+
+def _transform_part(transform: Callable[[Any], Any], payloads: list[Any]) -> list[Any]:
+    return [transform(payload) for payload in payloads]
+
+
+def _next_users(after: int, limit: int) -> Users:
+    return [
+        (pk, user_id)
+        for pk, user_id in db.session.query(User.id, User.user_id)
+        .filter(User.id > after)
+        .order_by(User.id)
+        .limit(limit)
+    ]
+
+
+def _start_job(name: str, restart: bool) -> MaintenanceJob:
+    job = MaintenanceJob.query.filter_by(name=name).first()
+    if job is None:
+        job = MaintenanceJob(name=name)  # type: ignore
+        db.session.add(job)
+    elif restart or job.status == "finished":
+        job.status = "running"  # type: ignore
+        job.last_user_pk = 0  # type: ignore
+        job.users = job.rows = 0  # type: ignore
+        job.seconds = 0.0  # type: ignore
+        job.started_at = datetime.now(timezone.utc)  # type: ignore
+        job.finished_at = None  # type: ignore
+    else:
+        logger.info(
+            "maintenance_resumed", extra={"job": name, "after": job.last_user_pk}
+        )
+    db.session.commit()
+    return job
+
+
+def run_job(
+    name: str,
+    load: Callable[[Users], list[Any]],
+    transform: Callable[[Any], Any] | None,
+    store: Callable[[list[Any]], int],
+    chunk_size: int = 200,
+    workers: int = 1,
+    restart: bool = False,
+    progress: Callable[[MaintenanceJob], None] | None = None,
+) -> MaintenanceJob:
+    """Runs load -> transform (in the pool) -> store over every user in chunks.
+
+    transform must be a module level function, it's pickled into the workers.
+    store writes without committing, the checkpoint commits it.
+    """
+    job = _start_job(name, restart)
+    keys = get_encryption_keys()
+    _init_worker(keys)
+
+    pool = None
+    if transform is not None and workers > 1:
+        pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(keys,))
+
+    def submit(payloads: list[Any]) -> list[Future[list[Any]]] | list[Any]:
+        if transform is None:
+            return payloads
+        if pool is None:
+            return _transform_part(transform, payloads)
+        size = max(1, -(-len(payloads) // (workers * 2)))
+        return [
+            pool.submit(_transform_part, transform, payloads[i : i + size])
+            for i in range(0, len(payloads), size)
+        ]
+
+    def write(last_pk: int, users: int, submitted: list[Any]) -> None:
+        results = submitted
+        if pool is not None:
+            results = [r for future in submitted for r in future.result()]
+        rows = store(results)
+
+        job.last_user_pk = last_pk  # type: ignore
+        job.users += users  # type: ignore
+        job.rows += rows  # type: ignore
+        job.seconds = seconds_before + time.perf_counter() - start  # type: ignore
+        job.updated_at = datetime.now(timezone.utc)  # type: ignore
+        db.session.commit()
+        if progress is not None:
+            progress(job)
+
+    seconds_before = cast(float, job.seconds)
+    start = time.perf_counter()
+    cursor = cast(int, job.last_user_pk)
+    in_flight: tuple[int, int, list[Any]] | None = None
+    try:
+        while True:
+            users = _next_users(cursor, chunk_size)
+            submitted = None
+            if users:
+                cursor = users[-1][0]
+                submitted = (cursor, len(users), submit(load(users)))
+            # the previous chunk is written while the pool works on this one
+            if in_flight is not None:
+                write(*in_flight)
+            in_flight = submitted
+            if in_flight is None:
+                break
+    except BaseException:
+        db.session.rollback()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    job.status = "finished"  # type: ignore
+    job.finished_at = datetime.now(timezone.utc)  # type: ignore
+    db.session.commit()
+    logger.info(
+        "maintenance_finished",
+        extra={"job": name, "users": job.users, "rows": job.rows},
+    )
+    return job
+
+
+# reencrypt: every encrypted column under the current key
+
+
+def load_encrypted(users: Users) -> list[tuple[str, int, dict[str, str | None]]]:
+    user_ids = [user_id for _, user_id in users]
+    payloads = []
+    for table, (model, columns) in ENCRYPTED_COLUMNS.items():
+        query = db.session.query(
+            model.id, *(getattr(model, c) for c in columns)
+        ).filter(model.user_id.in_(user_ids))
+        for pk, *values in query:
+            payloads.append((table, pk, dict(zip(columns, values))))
+    return payloads
+
+
+# the loaded tokens come back too, store_encrypted only replaces them if
+# they're unchanged
+def rotate_row(
+    payload: tuple[str, int, dict[str, str | None]],
+) -> tuple[str, int, dict[str, str | None], dict[str, str | None]]:
+    table, pk, values = payload
+    cipher = build_cipher(_worker_keys)
+    rotated = {
+        column: cipher.rotate(token.encode()).decode() if token else token
+        for column, token in values.items()
+    }
+    return table, pk, values, rotated
+
+
+# a row the app wrote since it was loaded is left alone, the app already
+# encrypted it with the current key
+def store_encrypted(
+    results: list[tuple[str, int, dict[str, str | None], dict[str, str | None]]],
+) -> int:
+    by_table: dict[str, list[dict[str, Any]]] = {}
+    for table, pk, values, rotated in results:
+        by_table.setdefault(table, []).append(
+            {
+                "row_id": pk,
+                **{f"old_{c}": v for c, v in values.items()},
+                **{f"new_{c}": v for c, v in rotated.items()},
+            }
+        )
+
+    stored = 0
+    for table, params in by_table.items():
+        model, columns = ENCRYPTED_COLUMNS[table]
+        statement = (
+            update(model.__table__)
+            .where(
+                model.__table__.c.id == bindparam("row_id"),
+                *(
+                    model.__table__.c[c].is_not_distinct_from(bindparam(f"old_{c}"))
+                    for c in columns
+                ),
+            )
+            .values({c: bindparam(f"new_{c}") for c in columns})
+        )
+        result = db.session.connection().execute(statement, params)
+        if db.engine.dialect.supports_sane_multi_rowcount:
+            stored += result.rowcount
+        else:
+            stored += len(params)
+    return stored
+
+
+# reindex: the retrieval index rebuilt from each history
+
+
+def load_histories(users: Users) -> list[tuple[str, str]]:
+    user_ids = [user_id for _, user_id in users]
+    return [
+        (user_id, token)
+        for user_id, token in db.session.query(
+            Context.user_id, Context.messages_encrypted
+        ).filter(Context.user_id.in_(user_ids))
+    ]
+
+
+def index_history(
+    payload: tuple[str, str],
+) -> tuple[str, str, list[tuple[int, int, str]]]:
+    from src.retrieval import embed
+
+    user_id, token = payload
+    cipher = build_cipher(_worker_keys)
+    messages = codec.loads(cipher.decrypt(token.encode()))
+    if not messages:
+        return user_id, token, []
+
+    vectors = embed([m["content"] for m in messages])
+    blocks = []
+    for block, position in enumerate(range(0, len(vectors), RETRIEVAL_BLOCK_SIZE)):
+        chunk = vectors[position : position + RETRIEVAL_BLOCK_SIZE]
+        blocks.append((block, len(chunk), cipher.encrypt(chunk.tobytes()).decode()))
+    return user_id, token, blocks
+
+
+# users whose history changed since it was loaded are skipped, the chat turn
+# that changed it indexes the new messages itself
+def store_indexes(results: list[tuple[str, str, list[tuple[int, int, str]]]]) -> int:
+    if not results:
+        return 0
+
+    # locked until the checkpoint commits, so no chat turn slips in between
+    current = dict(
+        db.session.query(Context.user_id, Context.messages_encrypted)
+        .filter(Context.user_id.in_([user_id for user_id, _, _ in results]))
+        .with_for_update()
+        .all()
+    )
+    unchanged = [
+        (user_id, blocks)
+        for user_id, token, blocks in results
+        if current.get(user_id) == token
+    ]
+    if not unchanged:
+        return 0
+
+    db.session.execute(
+        delete(MessageIndexBlock).where(
+            MessageIndexBlock.user_id.in_([user_id for user_id, _ in unchanged])
+        )
+    )
+    rows = [
+        {"user_id": user_id, "block": block, "count": count, "vectors_encrypted": data}
+        for user_id, blocks in unchanged
+        for block, count, data in blocks
+    ]
+    if rows:
+        db.session.execute(insert(MessageIndexBlock), rows)
+    return len(rows)
+
+
+# purge-stale: free accounts without a purchase, inactive for a while
+
+
+# purchases from before the stripe_event table and tokens_purchased left no
+# record, a balance above the free allowance is taken as one too
+def stale_users_query(cutoff: datetime) -> Any:
+    last_active = func.coalesce(Context.updated_at, User.created_at)
+    stripe_events = db.session.query(StripeEvent.id).filter(
+        StripeEvent.user_id == User.user_id
+    )
+    return (
+        db.session.query(User.user_id)
+        .outerjoin(Context, Context.user_id == User.user_id)
+        .filter(
+            User.tier == "free",
+            User.tokens_purchased == 0,
+            User.tokens_available <= FREE_TOKENS,
+            ~stripe_events.exists(),
+            last_active < cutoff,
+        )
+    )
+
+
+def load_stale(cutoff: datetime) -> Callable[[Users], list[str]]:
+    def load(users: Users) -> list[str]:
+        pks = [pk for pk, _ in users]
+        query = stale_users_query(cutoff).filter(User.id.in_(pks))
+        return [user_id for (user_id,) in query]
+
+    return load
+
+
+# the chunk was loaded one chunk earlier, so the accounts are checked again
+# under lock and the ones that bought tokens or chatted since are kept
+def store_purge(cutoff: datetime) -> Callable[[list[str]], int]:
+    def store(user_ids: list[str]) -> int:
+        if not user_ids:
+            return 0
+        db.session.query(Context.id).filter(
+            Context.user_id.in_(user_ids)
+        ).with_for_update().all()
+        user_ids = [
+            user_id
+            for (user_id,) in stale_users_query(cutoff)
+            .filter(User.user_id.in_(user_ids))
+            .with_for_update(of=User)
+        ]
+        if not user_ids:
+            return 0
+
+        # children first, the same tables as DELETE /api/data plus the user
+        for model in (
+            Context,
+            Summary,
+            AnalysisCache,
+            Analysis,
+            SummarySegment,
+            MessageIndexBlock,
+            AnalysisBatchItem,
+            User,
+        ):
+            db.session.execute(delete(model).where(model.user_id.in_(user_ids)))
+        return len(user_ids)
+
+    return store
+
+
+def _report(job: MaintenanceJob) -> None:
+    seconds = cast(float, job.seconds) or 1e-9
+    click.echo(
+        f"{job.name}: {job.users} users, {job.rows} rows in {seconds:.1f}s "
+        f"({job.users / seconds:.0f} users/s, {job.rows / seconds:.0f} rows/s)"
+    )
+
+
+def _job_options(command: Callable[..., Any]) -> Callable[..., Any]:
+    command = click.option(
+        "--restart", is_flag=True, help="ignore the checkpoint of an unfinished run"
+    )(command)
+    command = click.option("--workers", default=os.cpu_count() or 1, show_default=True)(
+        command
+    )
+    command = click.option(
+        "--chunk-size", default=200, show_default=True, help="users per commit"
+    )(command)
+    return command
+
+
+@maintenance_cli.command("reencrypt")
+@_job_options
+def reencrypt_command(chunk_size: int, workers: int, restart: bool) -> None:
+    """Re-encrypt every encrypted column with ENCRYPTION_KEY.
+
+    Put the previous keys in ENCRYPTION_OLD_KEYS, the app keeps reading rows
+    that are not done yet, and remove them once this finished.
+    """
+    job = run_job(
+        "reencrypt",
+        load_encrypted,
+        rotate_row,
+        store_encrypted,
+        chunk_size,
+        workers,
+        restart,
+        progress=_report,
+    )
+    _report(job)
+
+
+@maintenance_cli.command("reindex")
+@_job_options
+def reindex_command(chunk_size: int, workers: int, restart: bool) -> None:
+    """Rebuild the retrieval index of every user from their history."""
+    job = run_job(
+        "reindex",
+        load_histories,
+        index_history,
+        store_indexes,
+        chunk_size,
+        workers,
+        restart,
+        progress=_report,
+    )
+    _report(job)
+
+
+@maintenance_cli.command("purge-stale")
+@click.option("--days", type=int, required=True, help="inactive for this long")
+@click.option("--dry-run", is_flag=True, help="only count the accounts")
+@_job_options
+def purge_stale_command(
+    days: int, dry_run: bool, chunk_size: int, workers: int, restart: bool
+) -> None:
+    """Delete free accounts without purchases that were inactive for --days."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    if dry_run:
+        click.echo(f"{stale_users_query(cutoff).count()} accounts would be deleted")
+        return
+
+    job = run_job(
+        "purge-stale",
+        load_stale(cutoff),
+        None,
+        store_purge(cutoff),
+        chunk_size,
+        workers,
+        restart,
+        progress=_report,
+    )
+    _report(job)
@@ -0,0 +1,410 @@
+# backend/src/metrics.py
+
+from contextlib import contextmanager
+from flask import Flask, current_app, g, has_request_context
+from src.config import METRICS_FLUSH_SECONDS
+from src.locks import (
+    HOST_LOCKS,
+    acquire_file_lock,
+    release_file_lock,
+    shared_directory,
+)
+from typing import Any, Iterator, cast
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+"""
+Every worker keeps its series in memory and writes them to its own file in
+METRICS_DIR every METRICS_FLUSH_SECONDS and when it exits. /metrics adds up
+the files of all workers on the host, like prometheus_client's multiprocess
+mode. Files of workers that exited are folded into one, counters
+and histograms keep their totals, gauges are dropped.
+"""
+
+logger = logging.getLogger(__name__)
+
+# seconds, roughly covering a fast db query up to a long llm response
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    return "{" + ",".join(pairs) + "}"
+
+
+class Histogram:
+    # values of workers that exited still count
+    per_process = False
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # label values -> (bucket counts, sum, count)
+        self._series: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            counts, total, count = self._series.get(
+                key, ([0] * len(self.buckets), 0.0, 0)
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._series[key] = (counts, total + value, count + 1)
+
+    def snapshot(self) -> dict[tuple[str, ...], Any]:
+        with self._lock:
+            return {k: (list(c), s, n) for k, (c, s, n) in self._series.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    @staticmethod
+    def combine(a: Any, b: Any) -> Any:
+        return [x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]
+
+    def render(self, series: dict[tuple[str, ...], Any]) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for key, (counts, total, count) in sorted(series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labels + ("le",), key + (str(bound),))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labels + ("le",), key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    per_process = False
+
+    def __init__(
+        self, name: str, description: str, labels: tuple[str, ...] = ()
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, ...], float] = {}
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> dict[tuple[str, ...], Any]:
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def combine(a: Any, b: Any) -> Any:
+        return a + b
+
+    def render(self, values: dict[tuple[str, ...], Any]) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+        ]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+# a counter that can go down, only workers that are running report it
+class Gauge(Counter):
+    per_process = True
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self, values: dict[tuple[str, ...], Any]) -> list[str]:
+        lines = super().render(values)
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+REGISTRY: list[Histogram | Counter] = []
+
+REQUEST_SECONDS = Histogram(
+    "reflektion_request_seconds",
+    "Time spent handling a request.",
+    labels=("endpoint", "method", "status"),
+)
+STAGE_SECONDS = Histogram(
+    "reflektion_stage_seconds",
+    "Time spent in a stage of request handling.",
+    labels=("stage",),
+)
+LLM_SECONDS = Histogram(
+    "reflektion_llm_seconds",
+    "Total duration of an LLM call.",
+    labels=("model",),
+)
+LLM_TTFT_SECONDS = Histogram(
+    "reflektion_llm_time_to_first_token_seconds",
+    "Time until the first streamed token of an LLM call.",
+    labels=("model",),
+)
+LLM_TOKENS = Counter(
+    "reflektion_llm_tokens_total",
+    "Tokens consumed by LLM calls.",
+    labels=("model", "direction"),
+)
+LLM_ERRORS = Counter(
+    "reflektion_llm_errors_total",
+    "LLM calls that failed.",
+    labels=("model",),
+)
+CHAT_ROUTES = Counter(
+    "reflektion_chat_route_total",
+    "Chat model routing decisions.",
+    labels=("model", "reason"),
+)
+ANALYSIS_CACHE = Counter(
+    "reflektion_analysis_cache_total",
+    "Analysis cache lookups.",
+    labels=("result",),
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "reflektion_llm_queue_depth",
+    "LLM calls waiting for a concurrency slot.",
+    labels=("priority",),
+)
+LLM_QUEUE_SECONDS = Histogram(
+    "reflektion_llm_queue_seconds",
+    "Time LLM calls waited for a concurrency slot.",
+    labels=("priority",),
+)
+LLM_ADMISSIONS = Counter(
+    "reflektion_llm_admissions_total",
+    "LLM calls by admission result.",
+    labels=("priority", "result"),
+)
+STRIPE_EVENTS = Counter(
+    "reflektion_stripe_events_total",
+    "Stripe webhook events by outcome.",
+    labels=("type", "result"),
+)
+DB_READS = Counter(
+    "reflektion_db_reads_total",
+    "Read-only requests by the database that served them.",
+    labels=("target", "reason"),
+)
+
+
+_directory: str | None = None
+_flushing_pid: int | None = None
+_path = ""
+_flush_lock = threading.Lock()
+
+Series = dict[str, dict[tuple[str, ...], Any]]  # metric name -> label values -> value
+
+
+def init_metrics(app: Flask) -> None:
+    if HOST_LOCKS:  # on windows /metrics only shows the worker that serves it
+        app.before_request(_start_flushing)
+
+
+# on a worker's first request, so neither a --preload master before it forks
+# nor cli commands write files
+def _start_flushing() -> None:
+    global _directory, _flushing_pid, _path
+    if _flushing_pid == os.getpid():
+        return
+    with _flush_lock:
+        if _flushing_pid == os.getpid():
+            return
+        directory = shared_directory(
+            current_app.config["METRICS_DIR"], "reflektion-metrics"
+        )
+        _path = os.path.join(directory, f"{os.getpid()}-{time.time_ns()}.json")
+        _directory, _flushing_pid = directory, os.getpid()
+    threading.Thread(target=_flush_forever, daemon=True).start()
+    atexit.register(_flush)
+
+
+# a forked child starts from zero, the parent reports what it counted itself.
+# Its locks are new, the parent may have held one while forking
+def _after_fork() -> None:
+    global _flush_lock, _directory, _flushing_pid
+    _flush_lock = threading.Lock()
+    _directory = _flushing_pid = None
+    for metric in REGISTRY:
+        metric._lock = threading.Lock()
+        metric.reset()
+
+
+if hasattr(os, "register_at_fork"):  # not on windows
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _flush() -> None:
+    if _flushing_pid == os.getpid():  # not a forked child's inherited atexit
+        _write(_path, {m.name: m.snapshot() for m in REGISTRY})
+
+
+def _flush_forever() -> None:
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            _flush()
+        except OSError as e:
+            logger.warning("metrics_flush_failed", extra={"error": str(e)})
+
+
+def _read(path: str) -> Series:
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {name: {tuple(k): v for k, v in pairs} for name, pairs in data.items()}
+
+
+def _write(path: str, series: Series) -> None:
+    data = {
+        name: [[list(k), v] for k, v in values.items()]
+        for name, values in series.items()
+    }
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)  # readers never see half a file
+
+
+def _add(into: Series, series: Series, running: bool) -> None:
+    metrics = {m.name: m for m in REGISTRY}
+    for name, values in series.items():
+        metric = metrics.get(name)
+        if metric is None or (metric.per_process and not running):
+            continue
+        merged = into.setdefault(name, {})
+        for key, value in values.items():
+            merged[key] = metric.combine(merged[key], value) if key in merged else value
+
+
+def _running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# the files of every worker added up, under a lock so a file being folded
+# into exited.json isn't counted twice
+def _collect() -> Series:
+    directory = cast(str, _directory)
+    if _flushing_pid == os.getpid():
+        _flush()
+
+    series: Series = {}
+    fd = acquire_file_lock(os.path.join(directory, "collect.lock"), timeout=None)
+    try:
+        exited_path = os.path.join(directory, "exited.json")
+        exited = _read(exited_path)
+        folded = []
+        for name in os.listdir(directory):
+            if not name.endswith(".json") or name == "exited.json":
+                continue
+            path = os.path.join(directory, name)
+            if _running(int(name.split("-")[0])):
+                _add(series, _read(path), running=True)
+            else:
+                _add(exited, _read(path), running=False)
+                folded.append(path)
+        if folded:
+            _write(exited_path, exited)
+            for path in folded:
+                os.remove(path)
+        _add(series, exited, running=False)
+    finally:
+        release_file_lock(fd)
+    return series
+
+
+def render_metrics() -> str:
+    if _directory:
+        series = _collect()
+    else:
+        series = {m.name: m.snapshot() for m in REGISTRY}
+
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(series.get(metric.name, {})))
+    return "\n".join(lines) + "\n"
+
+
+def record_stage(stage: str, elapsed: float) -> None:
+    STAGE_SECONDS.observe(elapsed, stage=stage)
+
+    # per request totals for the Server-Timing header
+    if has_request_context():
+        timings: dict[str, tuple[float, int]] = g.setdefault("timings", {})
+        total, count = timings.get(stage, (0.0, 0))
+        timings[stage] = (total + elapsed, count + 1)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def server_timing_header() -> str | None:
+    timings: dict[str, tuple[float, int]] = g.get("timings", {})
+    if not timings:
+        return None
+
+    entries = []
+    for stage, (total, count) in timings.items():
+        entries.append(f'{stage};desc="{count}x";dur={total * 1000:.1f}')
+    return ", ".join(entries)
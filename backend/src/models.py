@@ -1,11 +1,17 @@
 # backend/src/models.py
 
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from datetime import datetime, timezone
-from cryptography.fernet import Fernet
-from typing import TypedDict, cast
-from src.config import ENCRYPTION_KEY, FREE_TOKENS
-import json
+from cryptography.fernet import Fernet, MultiFernet
+from typing import Any, TypedDict, cast
+from src import codec
+from src.config import ENCRYPTION_KEY, ENCRYPTION_OLD_KEYS, FREE_TOKENS
+from src.metrics import record_stage, timed
+from src.replica import RoutingSession
+import time
 
 
 # data types
@@ -30,19 +36,110 @@ class AnalysisDict(TypedDict):
     timestamp: str
 
 
-db = SQLAlchemy()
+# reads in @replica_reads views can go to the "replica" bind
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
-if not ENCRYPTION_KEY:
-    raise RuntimeError("ENCRYPTION_KEY is not set in environment variables")
-cipher = Fernet(ENCRYPTION_KEY.encode())
+
+# time every query, for all engines
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_query(conn, cursor, statement, parameters, context, executemany) -> None:  # type: ignore
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_query(conn, cursor, statement, parameters, context, executemany) -> None:  # type: ignore
+    record_stage("db_query", time.perf_counter() - conn.info["query_start"].pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def _failed_query(exception_context) -> None:  # type: ignore
+    starts = (
+        exception_context.connection.info.get("query_start")
+        if exception_context.connection
+        else None
+    )
+    if starts:
+        record_stage("db_query", time.perf_counter() - starts.pop())
+
+
+_ciphers: dict[tuple[str, ...], MultiFernet] = {}
+
+
+def get_encryption_keys() -> list[str]:
+    if has_app_context():
+        key = current_app.config["ENCRYPTION_KEY"]
+        old_keys = current_app.config.get("ENCRYPTION_OLD_KEYS") or []
+    else:
+        key, old_keys = ENCRYPTION_KEY, ENCRYPTION_OLD_KEYS
+    if not key:
+        raise RuntimeError("ENCRYPTION_KEY is not set in environment variables")
+    return [key, *old_keys]
+
+
+# encrypts with the current key, decrypts with any of them
+def build_cipher(keys: list[str]) -> MultiFernet:
+    cipher = _ciphers.get(tuple(keys))
+    if cipher is None:
+        cipher = _ciphers[tuple(keys)] = MultiFernet([Fernet(k.encode()) for k in keys])
+    return cipher
+
+
+# the app's keys inside an app context, the environment's otherwise
+def get_cipher() -> MultiFernet:
+    return build_cipher(get_encryption_keys())
 
 
 def encrypt(data: str) -> str:
-    return cipher.encrypt(data.encode()).decode()
+    with timed("encrypt"):
+        return get_cipher().encrypt(data.encode()).decode()
 
 
 def decrypt(data: str) -> str:
-    return cipher.decrypt(data.encode()).decode()
+    with timed("decrypt"):
+        return get_cipher().decrypt(data.encode()).decode()
+
+
+def encrypt_bytes(data: bytes) -> str:
+    with timed("encrypt"):
+        return get_cipher().encrypt(data).decode()
+
+
+def decrypt_bytes(data: str) -> bytes:
+    with timed("decrypt"):
+        return get_cipher().decrypt(data.encode())
+
+
+# all encrypted json columns go through the codec
+def encrypt_json(value: Any) -> str:
+    return encrypt(codec.dumps(value))
+
+
+def decrypt_json(data: str) -> Any:
+    return codec.loads(decrypt(data))
+
+
+# create_all doesn't add columns to existing tables
+ADDED_COLUMNS = {
+    "analysis": {"watermark": "INTEGER"},
+    "context": {"message_count": "INTEGER"},
+    "summary": {"watermark": "INTEGER"},
+    "user": {
+        "tokens_purchased": "INTEGER NOT NULL DEFAULT 0",
+        "last_write_at": "FLOAT",
+    },
+}
+
+
+def upgrade_schema() -> None:
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            for name, ddl in columns.items():
+                if name not in existing:
+                    conn.execute(
+                        db.text(f'ALTER TABLE "{table}" ADD COLUMN {name} {ddl}')
+                    )
 
 
 class User(db.Model):
@@ -56,9 +153,14 @@ class User(db.Model):
     tier = db.Column(db.String(20), default="free", nullable=False)
     tokens_used = db.Column(db.Integer, default=0, nullable=False)
     tokens_available = db.Column(db.Integer, default=FREE_TOKENS, nullable=False)
+    # lifetime total, only counted since the stripe_event table exists
+    tokens_purchased = db.Column(db.Integer, default=0, nullable=False)
     tokens_reset_date = db.Column(
         db.Date, default=lambda: datetime.now(timezone.utc).date(), nullable=False
     )
+    # time.time() of the user's last committed write, their reads stay on the
+    # primary for a while after it
+    last_write_at = db.Column(db.Float)
 
     # relationships
     context = db.relationship(
@@ -70,6 +172,27 @@ class User(db.Model):
     summary = db.relationship(
         "Summary", backref="user", uselist=False, cascade="all, delete-orphan"
     )
+    analysis_cache = db.relationship(
+        "AnalysisCache", backref="user", uselist=False, cascade="all, delete-orphan"
+    )
+    summary_segments = db.relationship(
+        "SummarySegment",
+        backref="user",
+        lazy="dynamic",
+        cascade="all, delete-orphan",
+    )
+    message_index_blocks = db.relationship(
+        "MessageIndexBlock",
+        backref="user",
+        lazy="dynamic",
+        cascade="all, delete-orphan",
+    )
+    batch_items = db.relationship(
+        "AnalysisBatchItem",
+        backref="user",
+        lazy="dynamic",
+        cascade="all, delete-orphan",
+    )
 
 
 class Context(db.Model):
@@ -80,17 +203,19 @@ class Context(db.Model):
         db.String(100), db.ForeignKey("user.user_id"), nullable=False, unique=True
     )
     messages_encrypted = db.Column(db.Text, nullable=False)
+    # len(messages), so it can be compared with watermarks without decrypting,
+    # null for rows saved before the column existed
+    message_count = db.Column(db.Integer)
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
     @property
     def messages(self) -> list[dict[str, str]]:
-        decrypted = decrypt(self.messages_encrypted)
-        return json.loads(decrypted)
+        return decrypt_json(self.messages_encrypted)
 
     @messages.setter
     def messages(self, value: list[dict[str, str]]) -> None:
-        json_str = json.dumps(value)
-        self.messages_encrypted = encrypt(json_str)
+        self.messages_encrypted = encrypt_json(value)
+        self.message_count = len(value)
 
 
 class Analysis(db.Model):
@@ -103,6 +228,8 @@ class Analysis(db.Model):
     big_five_personality_encrypted = db.Column(db.Text)
     thinking_patterns_encrypted = db.Column(db.Text)
     communication_style_encrypted = db.Column(db.Text)
+    # number of messages in the history when analysed
+    watermark = db.Column(db.Integer)
     timestamp = db.Column(
         db.DateTime,
         default=lambda: datetime.now(timezone.utc),
@@ -114,46 +241,40 @@ class Analysis(db.Model):
     def big_five_personality(self) -> BigFiveDict | None:
         if not self.big_five_personality_encrypted:
             return None
-        decrypted = decrypt(self.big_five_personality_encrypted)
-        return cast(BigFiveDict, json.loads(decrypted))
+        return cast(BigFiveDict, decrypt_json(self.big_five_personality_encrypted))
 
     @big_five_personality.setter
     def big_five_personality(self, value: BigFiveDict | None) -> None:
         if value is None:
             self.big_five_personality_encrypted = None
         else:
-            json_str = json.dumps(value)
-            self.big_five_personality_encrypted = encrypt(json_str)
+            self.big_five_personality_encrypted = encrypt_json(value)
 
     @property
     def thinking_patterns(self) -> dict | None:
         if not self.thinking_patterns_encrypted:
             return None
-        decrypted = decrypt(self.thinking_patterns_encrypted)
-        return json.loads(decrypted)
+        return decrypt_json(self.thinking_patterns_encrypted)
 
     @thinking_patterns.setter
     def thinking_patterns(self, value: dict | None) -> None:
         if value is None:
             self.thinking_patterns_encrypted = None
         else:
-            json_str = json.dumps(value)
-            self.thinking_patterns_encrypted = encrypt(json_str)
+            self.thinking_patterns_encrypted = encrypt_json(value)
 
     @property
     def communication_style(self) -> dict | None:
         if not self.communication_style_encrypted:
             return None
-        decrypted = decrypt(self.communication_style_encrypted)
-        return json.loads(decrypted)
+        return decrypt_json(self.communication_style_encrypted)
 
     @communication_style.setter
     def communication_style(self, value: dict | None) -> None:
         if value is None:
             self.communication_style_encrypted = None
         else:
-            json_str = json.dumps(value)
-            self.communication_style_encrypted = encrypt(json_str)
+            self.communication_style_encrypted = encrypt_json(value)
 
     def to_dict(self) -> dict:
         return {
@@ -161,10 +282,114 @@ class Analysis(db.Model):
             "big_five_personality": self.big_five_personality,
             "thinking_patterns": self.thinking_patterns,
             "communication_style": self.communication_style,
+            "watermark": self.watermark,
             "timestamp": self.timestamp.isoformat(),
         }
 
 
+# only hashes and row ids, never plaintext
+class AnalysisCache(db.Model):
+    __tablename__ = "analysis_cache"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.String(100), db.ForeignKey("user.user_id"), nullable=False, unique=True
+    )
+    content_hash = db.Column(db.String(64), nullable=False)
+    analysis_id = db.Column(db.Integer, db.ForeignKey("analysis.id"), nullable=False)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    # lets the unit of work delete this row before the analysis it points at
+    # when a user is deleted
+    analysis = db.relationship("Analysis")
+
+
+# message vectors for retrieval, RETRIEVAL_BLOCK_SIZE rows per block so an
+# append only rewrites the last one
+class MessageIndexBlock(db.Model):
+    __tablename__ = "message_index_block"
+    __table_args__ = (db.UniqueConstraint("user_id", "block"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.String(100), db.ForeignKey("user.user_id"), nullable=False, index=True
+    )
+    block = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    vectors_encrypted = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    # raw int8 rows, see src.retrieval
+    @property
+    def vectors(self) -> bytes:
+        return decrypt_bytes(self.vectors_encrypted)
+
+    @vectors.setter
+    def vectors(self, value: bytes) -> None:
+        self.vectors_encrypted = encrypt_bytes(value)
+
+
+class AnalysisBatch(db.Model):
+    __tablename__ = "analysis_batch"
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.String(100), unique=True)
+    status = db.Column(db.String(20), default="in_progress", nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    ended_at = db.Column(db.DateTime)
+
+    items = db.relationship(
+        "AnalysisBatchItem", backref="batch", cascade="all, delete-orphan"
+    )
+
+
+class AnalysisBatchItem(db.Model):
+    __tablename__ = "analysis_batch_item"
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_pk = db.Column(
+        db.Integer, db.ForeignKey("analysis_batch.id"), nullable=False, index=True
+    )
+    user_id = db.Column(
+        db.String(100), db.ForeignKey("user.user_id"), nullable=False, index=True
+    )
+    watermark = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default="pending", nullable=False)
+
+
+# webhook deliveries, the unique event id turns retries and replays into no-ops
+class StripeEvent(db.Model):
+    __tablename__ = "stripe_event"
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(255), unique=True, nullable=False)
+    type = db.Column(db.String(100), nullable=False)
+    # no foreign key, the user may not exist yet
+    user_id = db.Column(db.String(100))
+    tokens = db.Column(db.Integer)
+    status = db.Column(db.String(20), default="pending", nullable=False, index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text)
+    received_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    processed_at = db.Column(db.DateTime)
+
+
+# progress of `flask maintenance` jobs, committed with each batch they write
+class MaintenanceJob(db.Model):
+    __tablename__ = "maintenance_job"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    status = db.Column(db.String(20), default="running", nullable=False)
+    last_user_pk = db.Column(db.Integer, default=0, nullable=False)  # keyset cursor
+    users = db.Column(db.Integer, default=0, nullable=False)
+    rows = db.Column(db.Integer, default=0, nullable=False)
+    seconds = db.Column(db.Float, default=0.0, nullable=False)
+    started_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+
 class Summary(db.Model):
     __tablename__ = "summary"
 
@@ -173,6 +398,8 @@ class Summary(db.Model):
         db.String(100), db.ForeignKey("user.user_id"), nullable=False, unique=True
     )
     summary_encrypted = db.Column(db.Text, nullable=False)
+    # number of messages in the history when updated
+    watermark = db.Column(db.Integer)
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
     @property
@@ -182,3 +409,32 @@ class Summary(db.Model):
     @summary.setter
     def summary(self, value: str) -> None:
         self.summary_encrypted = encrypt(value)
+
+
+# summary tiers below the profile in Summary, written once and never updated
+class SummarySegment(db.Model):
+    __tablename__ = "summary_segment"
+    __table_args__ = (db.UniqueConstraint("user_id", "level", "seq"),)
+
+    SEGMENT = 0  # SUMMARY_SEGMENT_SIZE messages
+    PERIOD = 1  # SUMMARY_PERIOD_SEGMENTS segments
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.String(100), db.ForeignKey("user.user_id"), nullable=False, index=True
+    )
+    level = db.Column(db.Integer, nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    # covers chat_history[message_start:message_end]
+    message_start = db.Column(db.Integer, nullable=False)
+    message_end = db.Column(db.Integer, nullable=False)
+    summary_encrypted = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    @property
+    def summary(self) -> str:
+        return decrypt(self.summary_encrypted)
+
+    @summary.setter
+    def summary(self, value: str) -> None:
+        self.summary_encrypted = encrypt(value)
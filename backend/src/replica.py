@@ -0,0 +1,191 @@
+# backend/src/replica.py
+
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from src.auth import get_user_id
+from src.config import (
+    REPLICA_READ_YOUR_WRITES_SECONDS,
+    REPLICA_MAX_LAG_SECONDS,
+    REPLICA_CHECK_SECONDS,
+)
+from src.metrics import DB_READS
+from functools import wraps
+from typing import Any, Callable
+import logging
+import threading
+import time
+
+"""
+Read-only endpoints are wrapped in @replica_reads and their queries go to the
+"replica" bind (REPLICA_DATABASE_URI) unless:
+- the user committed a write in the last REPLICA_READ_YOUR_WRITES_SECONDS
+- the replica is down or further behind than REPLICA_MAX_LAG_SECONDS
+Flushes and other writes always go to the primary. If a query on the replica
+fails, the view is run again on the primary. The time of a user's last write
+is kept on their row on the primary, so every worker sees it, replica health
+is measured per process.
+"""
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_health: dict[str, tuple[bool, float]] = {}  # engine url -> (healthy, checked at)
+
+# 0 when the replica has replayed everything it received, NULL on a primary
+_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+# in the current transaction, so it's committed together with the write
+def mark_write(user_id: str) -> None:
+    from src.models import db, User
+
+    db.session.execute(
+        update(User).where(User.user_id == user_id).values(last_write_at=time.time())
+    )
+
+
+# asked before a view is routed, so the primary answers
+def wrote_recently(user_id: str | None) -> bool:
+    from src.models import db, User
+
+    if user_id is None:
+        return False
+    at = db.session.query(User.last_write_at).filter_by(user_id=user_id).scalar()
+    return at is not None and time.time() - at < REPLICA_READ_YOUR_WRITES_SECONDS
+
+
+def replica_lag(engine: Engine) -> float:
+    with engine.connect() as conn:
+        if engine.dialect.name != "postgresql":
+            conn.execute(text("SELECT 1"))
+            return 0.0
+        return float(conn.execute(_LAG_QUERY).scalar() or 0)
+
+
+def set_replica_health(engine: Engine, healthy: bool) -> None:
+    with _lock:
+        _health[str(engine.url)] = (healthy, time.monotonic())
+
+
+# measured at most every REPLICA_CHECK_SECONDS
+def replica_healthy(engine: Engine) -> bool:
+    healthy, checked_at = _health.get(str(engine.url), (False, float("-inf")))
+    if time.monotonic() - checked_at < REPLICA_CHECK_SECONDS:
+        return healthy
+
+    # claim the check so concurrent requests use the previous result
+    set_replica_health(engine, healthy)
+    try:
+        lag = replica_lag(engine)
+        healthy = lag <= REPLICA_MAX_LAG_SECONDS
+        if not healthy:
+            logger.warning("replica_lagging", extra={"lag_seconds": lag})
+    except DBAPIError as e:
+        healthy = False
+        logger.warning("replica_unavailable", extra={"error": str(e)})
+    set_replica_health(engine, healthy)
+    return healthy
+
+
+class RoutingSession(Session):
+    def get_bind(
+        self,
+        mapper: Any | None = None,
+        clause: Any | None = None,
+        bind: Any | None = None,
+        **kwargs: Any,
+    ) -> Any:
+        if (
+            bind is None
+            and not self._flushing
+            and not (clause is not None and clause.is_dml)
+            and has_request_context()
+            and g.get("read_replica")
+        ):
+            engine = self._db.engines.get("replica")
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _after_flush(session: RoutingSession, flush_context: Any) -> None:
+    session.info["wrote"] = True
+
+
+# once per request, unless it runs long enough for its first mark to expire
+# before its last write, and only when there's a replica to keep reads off
+@event.listens_for(RoutingSession, "before_commit")
+def _before_commit(session: RoutingSession) -> None:
+    if (
+        not has_request_context()
+        or not g.get("user_id")
+        or "replica" not in session._db.engines
+        or time.time() - g.get("write_marked_at", float("-inf"))
+        < REPLICA_READ_YOUR_WRITES_SECONDS / 2
+    ):
+        return
+    session.flush()  # commit only flushes after this hook
+    if session.info.get("wrote"):
+        mark_write(g.user_id)
+        g.write_marked_at = time.time()
+
+
+# the rest of the request reads what it wrote
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session: RoutingSession) -> None:
+    if session.info.pop("wrote", False) and has_request_context():
+        g.read_replica = False
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _after_rollback(session: RoutingSession) -> None:
+    session.info.pop("wrote", None)
+
+
+def _read_target() -> tuple[str, str]:
+    from src.models import db
+
+    engine = db.engines.get("replica")
+    if engine is None:
+        return "primary", "no_replica"
+    if wrote_recently(get_user_id()):
+        return "primary", "recent_write"
+    if not replica_healthy(engine):
+        return "primary", "unhealthy"
+    return "replica", "healthy"
+
+
+# serves a read-only view from the replica when it's safe to
+def replica_reads(view: Callable[..., Any]) -> Callable[..., Any]:
+    @wraps(view)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        from src.models import db
+
+        target, reason = _read_target()
+        if target == "primary":
+            DB_READS.inc(target=target, reason=reason)
+            return view(*args, **kwargs)
+
+        g.read_replica = True
+        try:
+            response = view(*args, **kwargs)
+            DB_READS.inc(target=target, reason=reason)
+            return response
+        except DBAPIError as e:
+            db.session.rollback()
+            set_replica_health(db.engines["replica"], False)
+            logger.warning("replica_failover", extra={"error": str(e)})
+        finally:
+            g.read_replica = False
+
+        DB_READS.inc(target="primary", reason="failover")
+        return view(*args, **kwargs)
+
+    return wrapper
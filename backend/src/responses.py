@@ -0,0 +1,114 @@
+# backend/src/responses.py
+
+from flask import Response, current_app, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from src import codec
+from src.config import (
+    BROTLI_QUALITY,
+    COMPRESS_MIN_BYTES,
+    COMPRESS_MIMETYPES,
+    GZIP_LEVEL,
+    STREAM_CHUNK_ITEMS,
+    STREAM_MIN_ITEMS,
+)
+from src.metrics import timed
+from typing import Any, Iterable, Iterator
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+
+# prevent caching in cloud
+def no_cache(response: Response) -> Response:
+    response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+    response.headers["Pragma"] = "no-cache"
+    response.headers["Expires"] = "0"
+    return response
+
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """Flask's provider, with jsonify bodies encoded by the codec's backend.
+
+    The output is the same compact, key sorted json, only orjson doesn't
+    escape non-ascii characters.
+    """
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        # pretty printed in debug, like the default
+        if self.compact is False or (self.compact is None and self._app.debug):  # type: ignore
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        body = codec.dumps_response(obj, self.default) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)  # type: ignore
+
+
+# {key: items} like jsonify, long arrays are encoded a chunk at a time while
+# they're sent instead of as one string
+def json_array_response(key: str, items: list[Any]) -> Response:
+    if len(items) < STREAM_MIN_ITEMS:
+        return jsonify({key: items})
+
+    default = current_app.json.default  # type: ignore
+
+    def generate() -> Iterator[bytes]:
+        yield b"{" + codec.dumps_response(key, default) + b":["
+        for start in range(0, len(items), STREAM_CHUNK_ITEMS):
+            chunk = codec.dumps_response(
+                items[start : start + STREAM_CHUNK_ITEMS], default
+            )
+            yield (b"," if start else b"") + chunk[1:-1]
+        yield b"]}\n"
+
+    return current_app.response_class(generate(), mimetype="application/json")
+
+
+def _compress(chunks: Iterable[bytes | str], encoding: str) -> Iterator[bytes]:
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)  # type: ignore
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # gzip framing
+        compress, finish = compressor.compress, compressor.flush
+
+    for chunk in chunks:
+        data = compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+# gzip or brotli, whichever the client prefers, above COMPRESS_MIN_BYTES and
+# for every streamed response
+def compress_response(response: Response) -> Response:
+    if (
+        request.method == "HEAD"
+        or not 200 <= response.status_code < 300
+        or response.status_code == 204
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESS_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    encoding = request.accept_encodings.best_match(offered)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress(response.response, encoding)  # type: ignore
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        with timed("compress"):
+            response.set_data(b"".join(_compress([data], encoding)))
+
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,243 @@
+# backend/src/retrieval.py
+
+from src.models import db, MessageIndexBlock
+from src.config import (
+    RETRIEVAL_DIM,
+    RETRIEVAL_BLOCK_SIZE,
+    RETRIEVAL_TOP_K,
+    RETRIEVAL_MIN_SCORE,
+    RETRIEVAL_CACHE_BYTES,
+)
+from src.metrics import timed
+from collections import OrderedDict
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from typing import TYPE_CHECKING, cast
+import re
+import threading
+import zlib
+
+# numpy is only needed once a chat turn searches or indexes
+if TYPE_CHECKING:
+    import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+
+# words shorter than three letters are skipped as well
+STOP_WORDS = frozenset(
+    "about and are but for from had has have its just not that the this "
+    "was were what when with you your".split()
+)
+
+
+def embed(texts: list[str]) -> "np.ndarray":
+    """Hashing vectorizer, one L2 normalised row per text, quantised to int8."""
+    import numpy as np
+
+    rows, columns, signs = [], [], []
+    for row, text in enumerate(texts):
+        for token in _TOKEN.findall(text.lower()):
+            if len(token) < 3 or token in STOP_WORDS:
+                continue
+            # crc32 is stable across processes, unlike hash()
+            h = zlib.crc32(token.encode())
+            rows.append(row)
+            columns.append(h % RETRIEVAL_DIM)
+            signs.append(1.0 if h & 0x80000000 else -1.0)
+
+    matrix = np.zeros((len(texts), RETRIEVAL_DIM), dtype=np.float32)
+    np.add.at(matrix, (rows, columns), signs)
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return np.rint(matrix * 127).astype(np.int8)
+
+
+def _decode(data: bytes) -> "np.ndarray":
+    import numpy as np
+
+    return np.frombuffer(data, dtype=np.int8).reshape(-1, RETRIEVAL_DIM)
+
+
+def _load(block: MessageIndexBlock) -> "np.ndarray":
+    return _decode(block.vectors)
+
+
+# full blocks never change, decrypting them dominates a search so each process
+# keeps the most recently used ones, keyed by row id and the start of the
+# fernet token (which includes its random iv)
+_cache_lock = threading.Lock()
+_block_cache: "OrderedDict[tuple[int, str], np.ndarray]" = OrderedDict()
+_cache_bytes = 0
+_TOKEN_PREFIX = 64
+
+
+def _cache_get(key: tuple[int, str]) -> "np.ndarray | None":
+    with _cache_lock:
+        vectors = _block_cache.get(key)
+        if vectors is not None:
+            _block_cache.move_to_end(key)
+        return vectors
+
+
+def _cache_put(key: tuple[int, str], vectors: "np.ndarray") -> None:
+    global _cache_bytes
+    with _cache_lock:
+        if key in _block_cache:
+            return
+        _block_cache[key] = vectors
+        _cache_bytes += vectors.nbytes
+        while _cache_bytes > RETRIEVAL_CACHE_BYTES and _block_cache:
+            _, evicted = _block_cache.popitem(last=False)
+            _cache_bytes -= evicted.nbytes
+
+
+def _load_blocks(user_id: str, before: int) -> list["np.ndarray"]:
+    keys = (
+        db.session.query(
+            MessageIndexBlock.id,
+            MessageIndexBlock.count,
+            func.substr(MessageIndexBlock.vectors_encrypted, 1, _TOKEN_PREFIX),
+        )
+        .filter_by(user_id=user_id)
+        .filter(MessageIndexBlock.block * RETRIEVAL_BLOCK_SIZE < before)
+        .order_by(MessageIndexBlock.block)
+        .all()
+    )
+
+    loaded: dict[int, "np.ndarray"] = {}
+    missing = []
+    for block_id, count, prefix in keys:
+        vectors = _cache_get((block_id, prefix))
+        if vectors is None:
+            missing.append(block_id)
+        else:
+            loaded[block_id] = vectors
+
+    if missing:
+        for block in MessageIndexBlock.query.filter(MessageIndexBlock.id.in_(missing)):
+            vectors = _load(block)
+            loaded[block.id] = vectors
+            if block.count == RETRIEVAL_BLOCK_SIZE:
+                prefix = block.vectors_encrypted[:_TOKEN_PREFIX]
+                _cache_put((block.id, prefix), vectors)
+
+    return [loaded[block_id] for block_id, _, _ in keys if block_id in loaded]
+
+
+def _indexed_count(last: MessageIndexBlock | None) -> int:
+    if last is None:
+        return 0
+    return cast(int, last.block) * RETRIEVAL_BLOCK_SIZE + cast(int, last.count)
+
+
+def index_messages(user_id: str, chat_history: list[dict[str, str]]) -> int:
+    with timed("index"):
+        return _index_messages(user_id, chat_history)
+
+
+# embeds the messages appended since the last call, only the last block is
+# rewritten
+def _index_messages(user_id: str, chat_history: list[dict[str, str]]) -> int:
+    import numpy as np
+
+    last = cast(
+        MessageIndexBlock | None,
+        MessageIndexBlock.query.filter_by(user_id=user_id)
+        .order_by(MessageIndexBlock.block.desc())
+        .first(),
+    )
+    indexed = _indexed_count(last)
+
+    # the history was replaced, start over
+    if indexed > len(chat_history):
+        MessageIndexBlock.query.filter_by(user_id=user_id).delete()
+        last, indexed = None, 0
+
+    new_messages = chat_history[indexed:]
+    if not new_messages:
+        return 0
+    vectors = embed([m["content"] for m in new_messages])
+
+    position = 0
+    if last is not None and last.count < RETRIEVAL_BLOCK_SIZE:
+        position = RETRIEVAL_BLOCK_SIZE - cast(int, last.count)
+        combined = np.concatenate([_load(last), vectors[:position]])
+        last.vectors = combined.tobytes()  # type: ignore
+        last.count = len(combined)  # type: ignore
+
+    block = 0 if last is None else cast(int, last.block) + 1
+    while position < len(vectors):
+        chunk = vectors[position : position + RETRIEVAL_BLOCK_SIZE]
+        entry = MessageIndexBlock(
+            user_id=user_id, block=block, count=len(chunk), vectors=chunk.tobytes()
+        )  # type: ignore
+        db.session.add(entry)
+        position += len(chunk)
+        block += 1
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # a concurrent request indexed the same messages, it catches up next time
+        db.session.rollback()
+        return 0
+    return len(new_messages)
+
+
+def retrieve_exchanges(
+    user_id: str,
+    query: str,
+    chat_history: list[dict[str, str]],
+    before: int,
+    k: int = RETRIEVAL_TOP_K,
+) -> list[list[dict[str, str]]]:
+    with timed("retrieval"):
+        return _retrieve_exchanges(user_id, query, chat_history, before, k)
+
+
+# the k past exchanges most similar to query among chat_history[:before], in
+# chronological order
+def _retrieve_exchanges(
+    user_id: str,
+    query: str,
+    chat_history: list[dict[str, str]],
+    before: int,
+    k: int,
+) -> list[list[dict[str, str]]]:
+    import numpy as np
+
+    if before <= 0 or k <= 0:
+        return []
+
+    # both sides are scaled by 127, scores end up as cosine similarity
+    query_vector = embed([query])[0].astype(np.float32) / (127 * 127)
+    if not query_vector.any():
+        return []
+
+    blocks = _load_blocks(user_id, before)
+    if not blocks:
+        return []
+
+    # float32 per block keeps the temporary copies small
+    scores = np.concatenate([b.astype(np.float32) @ query_vector for b in blocks])[
+        :before
+    ]
+
+    # a few extra candidates, two hits can share an exchange
+    candidates = min(len(scores), 2 * k)
+    top = np.argpartition(scores, -candidates)[-candidates:]
+    top = top[np.argsort(scores[top])[::-1]]
+
+    starts: list[int] = []
+    for index in top:
+        if scores[index] < RETRIEVAL_MIN_SCORE or len(starts) >= k:
+            break
+        # the user message and the reply to it
+        start = int(index)
+        if chat_history[start]["role"] != "user" and start > 0:
+            start -= 1
+        if start not in starts:
+            starts.append(start)
+
+    return [chat_history[start : min(start + 2, before)] for start in sorted(starts)]
@@ -0,0 +1,25 @@
+# backend/src/routes/__init__.py
+
+from flask import Flask
+from src.routes import system, chat, analysis, account, billing
+
+"""
+Endpoints:
+- GET /health
+- GET /metrics (bearer METRICS_TOKEN)
+- POST /api/chat
+- GET /api/messages
+- DELETE /api/data
+- GET /api/analysis
+- POST /api/analyse
+- GET /api/summary
+- DELETE /api/user
+- GET /api/usage
+- POST /api/create-checkout
+- POST /api/stripe-webhook
+"""
+
+
+def register_blueprints(app: Flask) -> None:
+    for module in (system, chat, analysis, account, billing):
+        app.register_blueprint(module.bp)
@@ -0,0 +1,42 @@
+# backend/src/routes/account.py
+
+from flask import Blueprint, jsonify
+from src.models import db
+from src.config import RATE_LIMITS
+from src.auth import get_user_id
+from src.rate_limit import limiter
+from src.replica import replica_reads
+from src.responses import no_cache
+from src.services import get_or_create_user
+from src.usage import get_user_usage
+
+bp = Blueprint("account", __name__)
+
+
+@bp.route("/api/user", methods=["DELETE"])
+@limiter.limit(RATE_LIMITS["delete"])
+def delete_user():
+    # authentication
+    user_id = get_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    # delete user (cascades to all data)
+    user = get_or_create_user(user_id)
+    db.session.delete(user)
+    db.session.commit()
+
+    return jsonify({"message": "User deleted"})
+
+
+@bp.route("/api/usage", methods=["GET"])
+@limiter.limit(RATE_LIMITS["read"])
+@replica_reads
+def get_usage():
+    # authentication
+    user_id = get_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    usage = get_user_usage(user_id)
+    return no_cache(jsonify(usage))
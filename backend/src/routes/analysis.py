@@ -0,0 +1,107 @@
+# backend/src/routes/analysis.py
+
+from flask import Blueprint, request, jsonify
+from src.models import db, Analysis
+from src.ai import analysis_ai
+from src.config import RATE_LIMITS
+from src.auth import get_user_id
+from src.cache import single_flight
+from src.metrics import ANALYSIS_CACHE
+from src.rate_limit import limiter
+from src.replica import replica_reads
+from src.responses import json_array_response, no_cache
+from src.services import (
+    analyse_user_conversation,
+    update_user_summary,
+    get_or_create_user,
+    analysis_cache_key,
+    get_cached_analysis,
+    cache_analysis,
+)
+from src.usage import check_token_limit, use_tokens
+from typing import cast
+
+bp = Blueprint("analysis", __name__)
+
+
+@bp.route("/api/analysis", methods=["GET"])
+@limiter.limit(RATE_LIMITS["read"])
+@replica_reads
+def get_analysis():
+    # authentication
+    user_id = get_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    analyses = cast(
+        list[Analysis],
+        Analysis.query.filter_by(user_id=user_id)
+        .order_by(Analysis.timestamp.desc())
+        .limit(30)
+        .all(),
+    )
+
+    return no_cache(json_array_response("analysis", [a.to_dict() for a in analyses]))
+
+
+@bp.route("/api/analyse", methods=["POST"])
+@limiter.limit(RATE_LIMITS["analysis"])
+def post_analyse():
+    # authentication
+    user_id = get_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    if not check_token_limit(user_id):
+        return jsonify({"error": "Token limit reached"}), 429
+
+    # a full re-analysis instead of only the messages since the last one
+    data = request.get_json(silent=True) or {}
+    full = bool(data.get("full", False))
+
+    # concurrent requests for the same user wait for one computation
+    with single_flight(f"analyse:{user_id}") as leader:
+        if not leader:
+            db.session.expire_all()
+        content_hash = analysis_cache_key(user_id)
+
+        # nothing changed since the last run
+        cached = None if full else get_cached_analysis(user_id, content_hash)
+        if cached:
+            ANALYSIS_CACHE.inc(result="hit" if leader else "coalesced")
+            user = get_or_create_user(user_id)
+            summary = user.summary.summary if user.summary else None
+            return jsonify({"analysis": cached.to_dict(), "summary": summary})
+        ANALYSIS_CACHE.inc(result="miss")
+
+        analysis, analysis_tokens = analyse_user_conversation(
+            user_id, analysis_ai, full=full
+        )
+
+        if not analysis:
+            return jsonify({"error": "Not enough conversation data"}), 400
+
+        summary, summary_tokens = update_user_summary(user_id, analysis_ai)
+
+        total_tokens = analysis_tokens + summary_tokens
+        use_tokens(user_id, total_tokens)
+
+        cache_analysis(user_id, analysis)
+
+    return jsonify({"analysis": analysis.to_dict(), "summary": summary})
+
+
+@bp.route("/api/summary", methods=["GET"])
+@limiter.limit(RATE_LIMITS["read"])
+@replica_reads
+def get_summary():
+    # authentication
+    user_id = get_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    user = get_or_create_user(user_id)
+    if not user.summary:
+        return no_cache(jsonify({"summary": None}))
+
+    return jsonify({"summary": user.summary.summary})
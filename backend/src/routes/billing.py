@@ -0,0 +1,85 @@
+# backend/src/routes/billing.py
+
+from flask import Blueprint, current_app, request, jsonify
+from src.config import RATE_LIMITS, ALLOWED_ORIGINS, TOKEN_PACKAGES
+from src.auth import get_user_id
+from src.rate_limit import limiter
+from src.billing import apply_after_response, record_stripe_event
+from types import ModuleType
+import logging
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint("billing", __name__)
+
+
+# imported on first use, the sdk is slow to import
+def get_stripe() -> ModuleType:
+    import stripe
+
+    return stripe
+
+
+@bp.route("/api/create-checkout", methods=["POST"])
+@limiter.limit(RATE_LIMITS["read"])
+def create_checkout():
+    # authentication
+    user_id = get_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.get_json()
+    package = data.get("packageType")
+
+    if package not in TOKEN_PACKAGES:
+        return jsonify({"error": "Invalid package"}), 400
+
+    stripe = get_stripe()
+    try:
+        checkout_session = stripe.checkout.Session.create(
+            api_key=current_app.config["STRIPE_SECRET_KEY"],
+            payment_method_types=["card"],
+            line_items=[
+                {
+                    "price": TOKEN_PACKAGES[package]["price_id"],
+                    "quantity": 1,
+                }
+            ],
+            mode="payment",
+            success_url=f"{ALLOWED_ORIGINS["production"]}/?success=true",
+            cancel_url=f"{ALLOWED_ORIGINS["production"]}/?canceled=true",
+            client_reference_id=user_id,
+            metadata={
+                "user_id": user_id,
+                "package": package,
+                "tokens": TOKEN_PACKAGES[package]["tokens"],
+            },
+        )
+
+        return jsonify({"url": checkout_session.url})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route("/api/stripe-webhook", methods=["POST"])
+@limiter.exempt  # stripe retries from a few addresses, the signature is the check
+def stripe_webhook():
+    payload = request.data
+    sig_header = request.headers.get("Stripe-Signature")
+
+    stripe = get_stripe()
+    try:
+        event = stripe.Webhook.construct_event(  # type: ignore
+            payload, sig_header, current_app.config["STRIPE_WEBHOOK_SECRET"]
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+    # record and acknowledge, tokens are credited once the response is sent
+    record = record_stripe_event(event)
+    response = jsonify({"status": "success"})
+    app = current_app._get_current_object()  # type: ignore
+    record_id = record.id if record is not None else None
+    response.call_on_close(lambda: apply_after_response(app, record_id))
+
+    return response
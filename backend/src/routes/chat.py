@@ -0,0 +1,158 @@
+# backend/src/routes/chat.py
+
+from flask import Blueprint, request, jsonify
+from src.models import (
+    db,
+    Analysis,
+    AnalysisBatchItem,
+    MessageIndexBlock,
+    SummarySegment,
+)
+from src.ai import chat_ai, analysis_ai
+from src.config import RATE_LIMITS, CHAT_WINDOW, SUMMARY_SEGMENT_SIZE
+from src.auth import get_user_id
+from src.rate_limit import limiter
+from src.replica import replica_reads
+from src.responses import json_array_response, no_cache
+from src.routing import choose_chat_model
+from src.services import (
+    load_user_chat_history,
+    save_context_to_db,
+    update_user_summary,
+    get_or_create_user,
+    build_summary_context,
+    _format_conversation,
+)
+from src.retrieval import index_messages, retrieve_exchanges
+from src.usage import check_token_limit, use_tokens
+from datetime import datetime, timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint("chat", __name__)
+
+
+@bp.route("/api/chat", methods=["POST"])
+@limiter.limit(RATE_LIMITS["chat"])
+def post_chat():
+    # authentication
+    user_id = get_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    # check tokens
+    if not check_token_limit(user_id):
+        return jsonify({"error": "Token limit reached"}), 429
+
+    data = request.get_json()
+    if not data or "message" not in data:
+        return jsonify({"error": "No data provided"}), 400
+
+    message_content = data["message"].strip()
+    if not message_content:
+        return jsonify({"error": "No message provided"}), 400
+
+    chat_history = load_user_chat_history(user_id)
+    chat_history.append(
+        {
+            "role": "user",
+            "content": message_content,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }
+    )
+
+    # lighter model for quick check-ins
+    tier = get_or_create_user(user_id).tier
+    model = choose_chat_model(message_content, len(chat_history), tier)
+
+    # older messages reach the model through their summaries
+    window = chat_history[-CHAT_WINDOW:]
+    while window and window[0]["role"] != "user":
+        window = window[1:]
+    context_parts = []
+    if len(chat_history) > len(window):
+        summary_context = build_summary_context(user_id)
+        if summary_context:
+            context_parts.append(
+                f"Earlier conversations with this user, summarised:\n{summary_context}"
+            )
+
+        # and the details the summaries dropped, when they're relevant
+        exchanges = retrieve_exchanges(
+            user_id, message_content, chat_history, len(chat_history) - len(window)
+        )
+        if exchanges:
+            context_parts.append(
+                "Earlier exchanges that may be relevant:\n"
+                + "\n\n".join(_format_conversation(e) for e in exchanges)
+            )
+    context = "\n\n".join(context_parts) or None
+
+    response_text, tokens = chat_ai.ask(window, model=model, context=context)  # type: ignore
+    if not response_text:
+        response_text = "Sorry, I couldn't generate a response right now."
+
+    chat_history.append(
+        {
+            "role": "assistant",
+            "content": response_text,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }
+    )
+
+    use_tokens(user_id, tokens)
+
+    save_context_to_db(user_id, chat_history)
+    index_messages(user_id, chat_history)
+
+    # rolling summary, ensures we don't lose information
+    if len(chat_history) > 0 and len(chat_history) % SUMMARY_SEGMENT_SIZE == 0:
+        logger.info("auto_summary", extra={"total_messages": len(chat_history)})
+        _, tokens = update_user_summary(user_id, analysis_ai)
+        use_tokens(user_id, tokens)
+
+    return jsonify({"response": response_text})
+
+
+@bp.route("/api/messages", methods=["GET"])
+@limiter.limit(RATE_LIMITS["read"])
+@replica_reads
+def get_messages():
+    # authentication
+    user_id = get_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    chat_history = load_user_chat_history(user_id)
+    return no_cache(json_array_response("messages", chat_history))
+
+
+@bp.route("/api/data", methods=["DELETE"])
+@limiter.limit(RATE_LIMITS["delete"])
+def delete_data():
+    # authentication
+    user_id = get_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    # clear from database
+    user = get_or_create_user(user_id)
+    if user.context:
+        db.session.delete(user.context)
+    if user.summary:
+        db.session.delete(user.summary)
+    if user.analysis_cache:
+        db.session.delete(user.analysis_cache)
+    db.session.flush()
+
+    Analysis.query.filter_by(user_id=user_id).delete()
+    SummarySegment.query.filter_by(user_id=user_id).delete()
+    MessageIndexBlock.query.filter_by(user_id=user_id).delete()
+    # batch results for the deleted conversation are never written back
+    AnalysisBatchItem.query.filter_by(user_id=user_id, status="pending").update(
+        {"status": "cancelled"}, synchronize_session=False
+    )
+    db.session.commit()
+
+    return jsonify({"message": "Data cleared"})
@@ -0,0 +1,28 @@
+# backend/src/routes/system.py
+
+from flask import Blueprint, Response, current_app, jsonify, request
+from src.metrics import render_metrics
+from src.rate_limit import limiter
+import hmac
+
+bp = Blueprint("system", __name__)
+
+
+@bp.route("/health", methods=["GET"])
+def health():
+    return jsonify({"status": "OK"})
+
+
+# off until METRICS_TOKEN is set, scrapers send it as a bearer token
+@bp.route("/metrics", methods=["GET"])
+@limiter.exempt
+def metrics():
+    token = current_app.config["METRICS_TOKEN"]
+    if not token:
+        return jsonify({"error": "Not found"}), 404
+
+    sent = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(sent.encode(), f"Bearer {token}".encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,59 @@
+# backend/src/routing.py
+
+from src.config import MODELS, CHAT_ROUTING_POLICIES, CHAT_MODEL_OVERRIDE
+from src.metrics import CHAT_ROUTES
+import logging
+
+logger = logging.getLogger(__name__)
+
+# phrases that ask for a thorough answer
+DEPTH_MARKERS = (
+    "in depth",
+    "in detail",
+    "go deeper",
+    "dig deeper",
+    "elaborate",
+    "explain",
+    "help me understand",
+    "think through",
+    "why do i",
+    "why am i",
+)
+
+
+def _resolve(model: str) -> str:
+    return MODELS.get(model, model)
+
+
+def route_chat_model(message: str, history_length: int, tier: str) -> tuple[str, str]:
+    if CHAT_MODEL_OVERRIDE:
+        return _resolve(CHAT_MODEL_OVERRIDE), "forced"
+
+    policy = CHAT_ROUTING_POLICIES.get(tier, CHAT_ROUTING_POLICIES["free"])
+    default_model = _resolve(policy["default_model"])
+
+    lowered = message.lower()
+    if any(marker in lowered for marker in DEPTH_MARKERS):
+        return default_model, "depth_requested"
+    if len(message) > policy["max_light_chars"]:
+        return default_model, "long_message"
+    if history_length > policy["max_light_depth"]:
+        return default_model, "deep_conversation"
+
+    return _resolve(policy["light_model"]), "light"
+
+
+def choose_chat_model(message: str, history_length: int, tier: str) -> str:
+    model, reason = route_chat_model(message, history_length, tier)
+    CHAT_ROUTES.inc(model=model, reason=reason)
+    logger.info(
+        "chat_route",
+        extra={
+            "model": model,
+            "reason": reason,
+            "tier": tier,
+            "message_chars": len(message),
+            "history_length": history_length,
+        },
+    )
+    return model
@@ -1,19 +1,54 @@
 # backend/src/services.py
 
-from src.models import db, User, Context, Analysis, Summary
+from src.models import (
+    db,
+    User,
+    Context,
+    Analysis,
+    AnalysisCache,
+    Summary,
+    SummarySegment,
+)
 from datetime import datetime, timezone
 from src.ai import AI
+from src.admission import Overloaded
 from src.config import (
     BIG_FIVE_PROMPT_HEADER,
     THINKING_PATTERNS_PROMPT_HEADER,
     COMMUNICATION_STYLE_PROMPT_HEADER,
     SUMMARY_PROMPT_HEADER,
+    SEGMENT_SUMMARY_PROMPT_HEADER,
+    PERIOD_SUMMARY_PROMPT_HEADER,
+    DELTA_ANALYSIS_PROMPT_HEADER,
     MIN_ANALYSIS_CONTEXT,
     MAX_CONTEXT,
+    SUMMARY_SEGMENT_SIZE,
+    SUMMARY_PERIOD_SEGMENTS,
+    SUMMARY_MAX_SEGMENTS_PER_UPDATE,
+    SUMMARY_CONTEXT_PERIODS,
 )
+from src.cache import single_flight
+from src.metrics import timed
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+import hashlib
 import json
+import logging
 from typing import cast
 
+logger = logging.getLogger(__name__)
+
+# changes whenever a prompt changes, so old cache entries stop matching
+ANALYSIS_PROMPT_VERSION = hashlib.sha256(
+    (
+        BIG_FIVE_PROMPT_HEADER
+        + THINKING_PATTERNS_PROMPT_HEADER
+        + COMMUNICATION_STYLE_PROMPT_HEADER
+        + DELTA_ANALYSIS_PROMPT_HEADER
+        + SUMMARY_PROMPT_HEADER
+    ).encode()
+).hexdigest()
+
 
 def get_or_create_user(user_id: str) -> User:
     user = cast(User | None, User.query.filter_by(user_id=user_id).first())
@@ -46,6 +81,59 @@ def save_context_to_db(user_id: str, chat_history: list[dict[str, str]]) -> None
     db.session.commit()
 
 
+def analysis_cache_key(user_id: str) -> str:
+    user = get_or_create_user(user_id)
+
+    # the history and profile ciphertexts change with every save and segments
+    # are only ever added, so none of them needs decrypting here
+    history = user.context.messages_encrypted if user.context else ""
+    message_count = user.context.message_count if user.context else 0
+    summary = user.summary.summary_encrypted if user.summary else ""
+    latest_segment = (
+        db.session.query(func.max(SummarySegment.id))
+        .filter_by(user_id=user_id)
+        .scalar()
+    )
+
+    digest = hashlib.sha256(ANALYSIS_PROMPT_VERSION.encode())
+    digest.update(hashlib.sha256(summary.encode()).digest())
+    digest.update(str(latest_segment).encode())
+    digest.update(str(message_count).encode())
+    digest.update(hashlib.sha256(history.encode()).digest())
+    return digest.hexdigest()
+
+
+def get_cached_analysis(user_id: str, content_hash: str) -> Analysis | None:
+    entry = cast(
+        AnalysisCache | None,
+        AnalysisCache.query.filter_by(
+            user_id=user_id, content_hash=content_hash
+        ).first(),
+    )
+    if not entry:
+        return None
+    return db.session.get(Analysis, entry.analysis_id)
+
+
+# keyed on the state after the analysis (and its summary update) so a repeat
+# request with nothing new hits
+def cache_analysis(user_id: str, analysis: Analysis) -> None:
+    content_hash = analysis_cache_key(user_id)
+    user = get_or_create_user(user_id)
+
+    if user.analysis_cache:
+        user.analysis_cache.content_hash = content_hash  # type: ignore
+        user.analysis_cache.analysis_id = analysis.id  # type: ignore
+        user.analysis_cache.updated_at = datetime.now(timezone.utc)  # type: ignore
+    else:
+        entry = AnalysisCache(
+            user_id=user_id, content_hash=content_hash, analysis_id=analysis.id
+        )  # type: ignore
+        db.session.add(entry)
+
+    db.session.commit()
+
+
 def _clean_json_response(text: str) -> str:
     text = text.replace("```json", "").replace("```", "").strip()
     start = text.find("{")
@@ -53,96 +141,341 @@ def _clean_json_response(text: str) -> str:
     return text[start : end + 1] if start != -1 and end != -1 else text
 
 
-def analyse_user_conversation(
-    user_id: str, analysis_ai: AI
-) -> tuple[Analysis | None, int]:
+# (prompt header, Analysis attribute) per analysis call
+ANALYSIS_PROMPTS = [
+    (BIG_FIVE_PROMPT_HEADER, "big_five_personality"),
+    (THINKING_PATTERNS_PROMPT_HEADER, "thinking_patterns"),
+    (COMMUNICATION_STYLE_PROMPT_HEADER, "communication_style"),
+]
 
-    chat_history = load_user_chat_history(user_id)
 
-    if len(chat_history) < MIN_ANALYSIS_CONTEXT:
-        return None, 0
-
-    # trim to MAX_CONTEXT for analysis
-    context_window = chat_history[-MAX_CONTEXT:]
+def get_latest_analysis(user_id: str) -> Analysis | None:
+    return cast(
+        Analysis | None,
+        Analysis.query.filter_by(user_id=user_id)
+        .order_by(Analysis.timestamp.desc())
+        .first(),
+    )
 
-    user = get_or_create_user(user_id)
-    existing_summary = ""
-    if user.summary:
-        existing_summary = (
-            f"\n\nPrevious conversation summary:\n{user.summary.summary}\n\n"
-        )
 
-    recent_conversation = "\n\n".join(
+def _format_conversation(messages: list[dict[str, str]]) -> str:
+    return "\n\n".join(
         [
             f"[{m.get('timestamp', 'unknown')}] {m['role'].title()}: {m['content']}"
-            for m in context_window
+            for m in messages
         ]
     )
 
-    big_five_prompt = (
-        BIG_FIVE_PROMPT_HEADER
-        + existing_summary
-        + "Recent conversation:\n"
-        + recent_conversation
-    )
-    thinking_prompt = (
-        THINKING_PATTERNS_PROMPT_HEADER
-        + existing_summary
-        + "Recent conversation:\n"
-        + recent_conversation
-    )
-    communication_prompt = (
-        COMMUNICATION_STYLE_PROMPT_HEADER
+
+# prompt per Analysis attribute, the watermark it covers and the mode,
+# prompts are None when there isn't enough conversation data and empty in
+# "current" mode, when the latest analysis already covers every message
+def build_analysis_prompts(
+    user_id: str, full: bool = False
+) -> tuple[dict[str, str] | None, int, str]:
+    chat_history = load_user_chat_history(user_id)
+    watermark = len(chat_history)
+
+    if len(chat_history) < MIN_ANALYSIS_CONTEXT:
+        return None, watermark, "full"
+
+    previous = None if full else get_latest_analysis(user_id)
+    if (
+        previous
+        and previous.watermark == watermark
+        and all(getattr(previous, a) is not None for _, a in ANALYSIS_PROMPTS)
+    ):
+        return {}, watermark, "current"
+
+    existing_summary = build_summary_context(user_id, SUMMARY_CONTEXT_PERIODS)
+    if existing_summary:
+        existing_summary = f"\n\nPrevious conversation summary:\n{existing_summary}\n\n"
+
+    # only the messages since the last analysis, when that's a small enough delta
+    if (
+        previous
+        and previous.watermark
+        and 0 < watermark - previous.watermark <= MAX_CONTEXT
+    ):
+        new_messages = _format_conversation(chat_history[previous.watermark :])
+        prompts = {}
+        for header, attribute in ANALYSIS_PROMPTS:
+            previous_result = getattr(previous, attribute)
+            if previous_result is None:
+                break
+            prompts[attribute] = (
+                header
+                + DELTA_ANALYSIS_PROMPT_HEADER
+                + existing_summary
+                + f"Previous result:\n{json.dumps(previous_result)}\n\n"
+                + "New messages since the last analysis:\n"
+                + new_messages
+            )
+        else:
+            return prompts, watermark, "delta"
+
+    # trim to MAX_CONTEXT for analysis
+    recent_conversation = _format_conversation(chat_history[-MAX_CONTEXT:])
+    prompts = {
+        attribute: header
         + existing_summary
         + "Recent conversation:\n"
         + recent_conversation
-    )
+        for header, attribute in ANALYSIS_PROMPTS
+    }
+    return prompts, watermark, "full"
+
+
+def analyse_user_conversation(
+    user_id: str, analysis_ai: AI, full: bool = False
+) -> tuple[Analysis | None, int]:
+    with timed("analysis"):
+        return _analyse_user_conversation(user_id, analysis_ai, full)
+
+
+def _analyse_user_conversation(
+    user_id: str, analysis_ai: AI, full: bool
+) -> tuple[Analysis | None, int]:
+
+    prompts, watermark, mode = build_analysis_prompts(user_id, full)
+    if prompts is None:
+        return None, 0
+    if mode == "current":
+        # e.g. a batch analysis landed after the cache entry was written
+        return get_latest_analysis(user_id), 0
 
     total_tokens = 0
 
     try:
-        big_five_text, tokens = analysis_ai.ask(
-            [{"role": "user", "content": big_five_prompt}]  # type: ignore
+        results = {}
+        for attribute, prompt in prompts.items():
+            text, tokens = analysis_ai.ask(
+                [{"role": "user", "content": prompt}]  # type: ignore
+            )
+            results[attribute] = json.loads(_clean_json_response(text))
+            total_tokens += tokens
+
+        analysis = Analysis(user_id=user_id, watermark=watermark, **results)  # type: ignore
+        db.session.add(analysis)
+        db.session.commit()
+
+        logger.info(
+            "analysis_complete",
+            extra={"mode": mode, "watermark": watermark, "tokens": total_tokens},
         )
-        big_five_text = _clean_json_response(big_five_text)
-        big_five_data = json.loads(big_five_text)
-        total_tokens += tokens
 
-        thinking_text, tokens = analysis_ai.ask(
-            [{"role": "user", "content": thinking_prompt}]  # type: ignore
+        return analysis, total_tokens
+
+    except Overloaded:
+        raise  # a 503 the client can retry, not "not enough data"
+
+    except Exception as e:
+        logger.error("analysis_failed", extra={"error": str(e)})
+        return None, 0
+
+
+def _format_messages(messages: list[dict[str, str]]) -> str:
+    return "\n\n".join([f"{m['role'].title()}: {m['content']}" for m in messages])
+
+
+def get_open_segments(user_id: str) -> list[SummarySegment]:
+    # segments not merged into a period yet
+    last_period = (
+        db.session.query(func.max(SummarySegment.seq))
+        .filter_by(user_id=user_id, level=SummarySegment.PERIOD)
+        .scalar()
+    )
+    first = 0 if last_period is None else (last_period + 1) * SUMMARY_PERIOD_SEGMENTS
+    return cast(
+        list[SummarySegment],
+        SummarySegment.query.filter_by(user_id=user_id, level=SummarySegment.SEGMENT)
+        .filter(SummarySegment.seq >= first)
+        .order_by(SummarySegment.seq)
+        .all(),
+    )
+
+
+# profile, the latest `periods` period summaries and the open segments, oldest
+# detail first
+def build_summary_context(user_id: str, periods: int = 0) -> str:
+    user = get_or_create_user(user_id)
+    parts = []
+    if user.summary:
+        parts.append(user.summary.summary)
+
+    if periods:
+        latest = cast(
+            list[SummarySegment],
+            SummarySegment.query.filter_by(user_id=user_id, level=SummarySegment.PERIOD)
+            .order_by(SummarySegment.seq.desc())
+            .limit(periods)
+            .all(),
         )
-        thinking_text = _clean_json_response(thinking_text)
-        thinking_data = json.loads(thinking_text)
-        total_tokens += tokens
+        for period in reversed(latest):
+            parts.append(
+                f"Messages {period.message_start + 1}-{period.message_end}:\n"
+                + period.summary
+            )
+
+    for segment in get_open_segments(user_id):
+        parts.append(
+            f"Messages {segment.message_start + 1}-{segment.message_end}:\n"
+            + segment.summary
+        )
+
+    return "\n\n".join(parts)
 
-        communication_text, tokens = analysis_ai.ask(
-            [{"role": "user", "content": communication_prompt}]  # type: ignore
+
+# summaries wait behind chat and give up when there's no capacity, whatever
+# they didn't get to is picked up by the next update
+def _summarise(prompt: str, analysis_ai: AI) -> tuple[str, int]:
+    try:
+        return analysis_ai.ask(
+            [{"role": "user", "content": prompt}], priority="summary"  # type: ignore
         )
-        communication_text = _clean_json_response(communication_text)
-        communication_data = json.loads(communication_text)
-        total_tokens += tokens
+    except Overloaded:
+        logger.warning("summary_deferred")
+        return "", 0
+
+
+def _close_period(user_id: str, seq: int, analysis_ai: AI) -> int:
+    segments = cast(
+        list[SummarySegment],
+        SummarySegment.query.filter_by(user_id=user_id, level=SummarySegment.SEGMENT)
+        .filter(
+            SummarySegment.seq >= seq * SUMMARY_PERIOD_SEGMENTS,
+            SummarySegment.seq < (seq + 1) * SUMMARY_PERIOD_SEGMENTS,
+        )
+        .order_by(SummarySegment.seq)
+        .all(),
+    )
 
-        analysis = Analysis(
+    prompt = (
+        PERIOD_SUMMARY_PROMPT_HEADER
+        + "\n\nSummaries:\n"
+        + "\n\n".join(s.summary for s in segments)
+    )
+    text, tokens = _summarise(prompt, analysis_ai)
+    if text:
+        period = SummarySegment(
             user_id=user_id,
-            big_five_personality=big_five_data,
-            thinking_patterns=thinking_data,
-            communication_style=communication_data,
+            level=SummarySegment.PERIOD,
+            seq=seq,
+            message_start=segments[0].message_start,
+            message_end=segments[-1].message_end,
+            summary=text,
         )  # type: ignore
-        db.session.add(analysis)
-        db.session.commit()
+        db.session.add(period)
+    return tokens
+
+
+# summarises full segments that have no summary yet, and merges every period
+# they complete
+def _close_segments(
+    user_id: str, chat_history: list[dict[str, str]], analysis_ai: AI
+) -> int:
+    last = cast(
+        SummarySegment | None,
+        SummarySegment.query.filter_by(user_id=user_id, level=SummarySegment.SEGMENT)
+        .order_by(SummarySegment.seq.desc())
+        .first(),
+    )
+    start = last.message_end if last else 0
+    seq = last.seq + 1 if last else 0
 
-        print(
-            f"✨ Analysis using {len(context_window)} messages (out of {len(chat_history)} total), {total_tokens} tokens"
+    total_tokens = 0
+
+    # a complete period whose merge failed on an earlier update
+    last_period = (
+        db.session.query(func.max(SummarySegment.seq))
+        .filter_by(user_id=user_id, level=SummarySegment.PERIOD)
+        .scalar()
+    )
+    next_period = 0 if last_period is None else last_period + 1
+    if (next_period + 1) * SUMMARY_PERIOD_SEGMENTS <= seq:
+        total_tokens += _close_period(user_id, next_period, analysis_ai)
+    for _ in range(SUMMARY_MAX_SEGMENTS_PER_UPDATE):
+        end = start + SUMMARY_SEGMENT_SIZE
+        if end > len(chat_history):
+            break
+
+        prompt = (
+            SEGMENT_SUMMARY_PROMPT_HEADER
+            + "\n\nConversation:\n"
+            + _format_messages(chat_history[start:end])
         )
+        text, tokens = _summarise(prompt, analysis_ai)
+        total_tokens += tokens
+        if not text:
+            break
 
-        return analysis, total_tokens
+        segment = SummarySegment(
+            user_id=user_id,
+            level=SummarySegment.SEGMENT,
+            seq=seq,
+            message_start=start,
+            message_end=end,
+            summary=text,
+        )  # type: ignore
+        db.session.add(segment)
 
-    except Exception as e:
-        print(f"❌ Analysis failed: {e}")
-        return None, 0
+        if (seq + 1) % SUMMARY_PERIOD_SEGMENTS == 0:
+            total_tokens += _close_period(
+                user_id, seq // SUMMARY_PERIOD_SEGMENTS, analysis_ai
+            )
+
+        start, seq = end, seq + 1
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # another worker summarised the same segments, none of ours were
+        # kept so the user isn't charged for them
+        db.session.rollback()
+        return 0
+    return total_tokens
+
+
+# what the profile hasn't seen yet: segment summaries where they exist, raw
+# messages for the rest
+def _new_summary_material(
+    user_id: str, chat_history: list[dict[str, str]], watermark: int
+) -> tuple[list[str], list[dict[str, str]]]:
+    segments = cast(
+        list[SummarySegment],
+        SummarySegment.query.filter_by(user_id=user_id, level=SummarySegment.SEGMENT)
+        .filter(SummarySegment.message_end > watermark)
+        .order_by(SummarySegment.seq)
+        .all(),
+    )
+
+    summaries = []
+    position = watermark
+    for segment in segments:
+        if segment.message_start < watermark:
+            # partly seen already, a segment's worth of messages at most
+            summaries.append(
+                _format_messages(chat_history[watermark : segment.message_end])
+            )
+        else:
+            summaries.append(segment.summary)
+        position = cast(int, segment.message_end)
+
+    # bounded even while older segments are still being backfilled
+    recent = chat_history[max(position, len(chat_history) - MAX_CONTEXT) :]
+    return summaries, recent
 
 
 def update_user_summary(user_id: str, analysis_ai: AI) -> tuple[str | None, int]:
+    with timed("summary"), single_flight(f"summary:{user_id}") as leader:
+        if not leader:
+            db.session.expire_all()
+        return _update_user_summary(user_id, analysis_ai)
+
+
+# only the newest segments and their parents are touched, so the cost doesn't
+# grow with the length of the history
+def _update_user_summary(user_id: str, analysis_ai: AI) -> tuple[str | None, int]:
 
     user = get_or_create_user(user_id)
     chat_history = load_user_chat_history(user_id)
@@ -150,36 +483,56 @@ def update_user_summary(user_id: str, analysis_ai: AI) -> tuple[str | None, int]
     if len(chat_history) < MIN_ANALYSIS_CONTEXT:
         return None, 0
 
-    # trim to MAX_CONTEXT for summary
-    context_window = chat_history[-MAX_CONTEXT:]
+    total_tokens = _close_segments(user_id, chat_history, analysis_ai)
 
     existing_summary = ""
+    watermark = 0
     if user.summary:
         existing_summary = user.summary.summary
+        # summaries from before the watermark covered the last MAX_CONTEXT
+        watermark = user.summary.watermark
+        if watermark is None:
+            watermark = max(len(chat_history) - MAX_CONTEXT, 0)
 
-    recent_conversation = "\n\n".join(
-        [f"{m['role'].title()}: {m['content']}" for m in context_window]
-    )
+    if user.summary and watermark >= len(chat_history):
+        return existing_summary, total_tokens
 
+    summaries, recent = _new_summary_material(user_id, chat_history, watermark)
     prompt = (
         SUMMARY_PROMPT_HEADER
         + f"\n\nPrevious summary:\n{existing_summary if existing_summary else 'None. This is the first summary.'}\n\n"
-        + f"Recent conversations:\n{recent_conversation}"
     )
+    if summaries:
+        prompt += "Conversations since then, summarised:\n" + "\n\n".join(summaries)
+        prompt += "\n\n"
+    if recent:
+        prompt += f"Recent conversations:\n{_format_messages(recent)}"
 
-    new_summary, tokens = analysis_ai.ask([{"role": "user", "content": prompt}])  # type: ignore
+    new_summary, tokens = _summarise(prompt, analysis_ai)
+    total_tokens += tokens
+    if not new_summary:
+        return existing_summary or None, total_tokens
 
     if user.summary:
         user.summary.summary = new_summary  # type: ignore
+        user.summary.watermark = len(chat_history)  # type: ignore
         user.summary.updated_at = datetime.now(timezone.utc)  # type: ignore
     else:
-        summary = Summary(user_id=user_id, summary=new_summary)  # type: ignore
+        summary = Summary(
+            user_id=user_id, summary=new_summary, watermark=len(chat_history)
+        )  # type: ignore
         db.session.add(summary)
 
     db.session.commit()
 
-    print(
-        f"✨ Summary using {len(context_window)} messages (out of {len(chat_history)} total), {tokens} tokens"
+    logger.info(
+        "summary_complete",
+        extra={
+            "segments": len(summaries),
+            "messages": len(recent),
+            "total_messages": len(chat_history),
+            "tokens": total_tokens,
+        },
     )
 
-    return new_summary, tokens
+    return new_summary, total_tokens
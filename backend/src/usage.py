@@ -1,7 +1,8 @@
-from src.models import db
+from src.models import db, User
 from datetime import datetime, timezone
 from src.config import FREE_TOKENS
 from src.services import get_or_create_user
+from sqlalchemy import update
 
 
 def check_token_limit(user_id: str) -> bool:
@@ -25,10 +26,21 @@ def use_tokens(user_id: str, tokens: int) -> None:
     db.session.commit()
 
 
+# an increment in sql, so concurrent updates can't lose it. Nothing is
+# committed here, not even a new user, the caller commits together with
+# whatever records the purchase
 def add_purchased_tokens(user_id: str, tokens: int) -> None:
-    user = get_or_create_user(user_id)
-    user.tokens_available += tokens  # type: ignore
-    db.session.commit()
+    if not db.session.query(User.id).filter_by(user_id=user_id).first():
+        db.session.add(User(user_id=user_id))  # type: ignore
+        db.session.flush()
+    db.session.execute(
+        update(User)
+        .where(User.user_id == user_id)
+        .values(
+            tokens_available=User.tokens_available + tokens,
+            tokens_purchased=User.tokens_purchased + tokens,
+        )
+    )
 
 
 def get_user_usage(user_id: str) -> dict[str, str | int]: